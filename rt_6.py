@@ -1,14 +1,51 @@
+from __future__ import annotations
+
+import abc
+import argparse
+import array
 import asyncio
+import bisect
+import email.utils
+import heapq
+import itertools
 import json
+import math
+import multiprocessing
 import os
+import random
 import re
+import shutil
+import signal
+import socket
+import sqlite3
+import stat
 import subprocess
 import sys
-from collections import deque
+import tempfile
+import threading
+import time
+import unicodedata
+import wave
+from collections import Counter, OrderedDict, deque
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, replace
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING
 
 import httpx
 from dotenv import load_dotenv
 from websockets.client import connect as websocket_connect  # type: ignore
+from websockets.exceptions import (  # type: ignore
+    ConnectionClosedOK,
+    InvalidStatusCode,
+)
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+# Тяжёлые модули грузятся лениво: aiohttp — только для --serve, numpy — в
+# фоне при старте сессии (load_numpy), пока VAD считает без него
+np = None
 
 load_dotenv()
 
@@ -19,20 +56,127 @@ DEEPL_API_KEY = os.getenv("DEEPL_API_KEY")
 SAMPLE_RATE = 16000
 CHANNELS = 1
 TRANSLATION_LANG = "EN"  # Изменяемо, напр. с EN на ES
+TARGET_LANG = "RU"
 CHUNK_DURATION = 0.1  # секунды
 CHUNK_SIZE = int(SAMPLE_RATE * CHUNK_DURATION * 2)  # 16-bit PCM = 2 байта
+FRAME_SIZE = CHANNELS * 2  # байт на один сэмпл всех каналов
+BYTES_PER_SECOND = SAMPLE_RATE * FRAME_SIZE
+# Адреса можно переопределить, напр. на локальные заглушки из rt_6_stubs.py
+DEEPGRAM_URL = os.getenv("DEEPGRAM_URL", "wss://api.deepgram.com/v1/listen")
+DEEPL_URL = os.getenv("DEEPL_URL", "https://api-free.deepl.com/v2/translate")
+DEEPL_USAGE_URL = DEEPL_URL.rsplit("/", 1)[0] + "/usage"
+# Сжатие звука перед отправкой в Deepgram: linear16 (без сжатия), opus или flac
+UPSTREAM_CODEC = os.getenv("UPSTREAM_CODEC", "linear16")
+OPUS_BITRATE = "24k"
 
 # Параметры оптимизации
 CONTEXT_WINDOW = 3  # Количество предыдущих фраз для контекста
 MAX_CACHE_SIZE = 150  # Максимальный размер кэша переводов
+MAX_CACHE_BYTES = 1_000_000  # Ограничение кэша по памяти (оценка)
+# Приближённый поиск в кэше: транскрипты, отличающиеся словами-паразитами,
+# пунктуацией или долей слов не больше порога, получают готовый перевод
+FUZZY_CACHE_ENABLED = False
+FUZZY_INTERIM_MAX_DISTANCE = 0.2  # доля отличающихся слов для interim
+FUZZY_FINAL_MAX_DISTANCE = 0.0  # финалы: только паразиты и пунктуация
+FUZZY_LOOKUP_BUDGET = 0.002  # секунды на один поиск
+FILLER_WORDS = {"um", "uh", "uhm", "umm", "er", "erm", "ah", "hmm", "mm"}
+CACHE_TTL: float | None = None  # Время жизни записи в секундах; None — без TTL
+INTERIM_MIN_STABLE_GROWTH = 2  # Прирост стабильного префикса (слов) для перевода
+INTERIM_DEBOUNCE = 0.6  # секунды между переводами interim без роста префикса
+# Спекулятивный перевод interim, похожего на конец фразы, до прихода финала
+SPECULATION_ENABLED = True
+SPECULATION_STABLE_TIME = 0.4  # секунды без изменений, после которых interim «готов»
+BATCH_WINDOW = 0.01  # секунды ожидания соседних текстов для общего запроса
+BATCH_MAX_SIZE = 25  # Максимум текстов в одном запросе DeepL (лимит API — 50)
+DEEPL_MAX_RPS = 20.0  # Общий для всех сессий процесса лимит запросов в секунду
+DEEPL_BURST = 10  # Сколько запросов можно отправить разом сверх лимита
+DEEPL_KEEPALIVE_EXPIRY = 60.0  # секунды жизни прогретого соединения без запросов
+DEEPL_MIN_RPS = 1.0  # Ниже этого лимит не опускается после ответов 429
+DEEPL_RATE_RECOVERY = 0.5  # запросов/с, возвращаемых лимиту за каждый успех
+DEEPL_INTERIM_MAX_WAIT = 0.5  # секунды; дольше interim в очереди не ждёт
+DEEPL_MAX_RETRIES = 3  # Повторы финала после 429
+DEEPL_RETRY_BASE_DELAY = 0.5  # секунды паузы после 429 без Retry-After
+DEEPL_RETRY_MAX_DELAY = 10.0
+PRIORITY_FINAL = 0  # Приоритеты запросов к DeepL: меньше — важнее
+PRIORITY_SPECULATIVE = 1  # перевод interim, который, вероятно, станет финалом
+PRIORITY_INTERIM = 2
+# Локальный VAD: тишина не отправляется в Deepgram
+VAD_ENABLED = True
+VAD_ENERGY_THRESHOLD = 300.0  # RMS (int16) ~ -40 dBFS
+VAD_ZCR_MAX = 0.35  # Доля пересечений нуля: выше — шум, а не речь
+VAD_HANGOVER = 0.8  # секунды тишины после речи, которые ещё отправляются
+VAD_PREROLL = 0.3  # секунды до начала речи, которые отправляются вместе с ней
+KEEPALIVE_INTERVAL = 5.0  # секунды; Deepgram закрывает сокет после ~10с без данных
+RENDER_FPS = 20.0  # Максимум перерисовок строки субтитров в секунду
+SINK_FLUSH_INTERVAL = 1.0  # секунды между записями файлов субтитров на диск
+# Раздача субтитров зрителям (websocket/SSE)
+BROADCAST_QUEUE_SIZE = 32  # сообщений в очереди клиента; дальше он «медленный»
+BROADCAST_HISTORY = 100  # последних финалов для подключившихся позже
+BROADCAST_HEARTBEAT = 15.0  # секунды между ping для websocket и SSE
+# Очередь захват → отправка для живого звука: сколько неотправленного звука
+# допускается и что делать сверх этого — отбрасывать самый старый звук
+# (drop-oldest), не ставить в очередь тишину (skip-silence) или ждать (none)
+SEND_QUEUE_SECONDS = 2.0
+OVERFLOW_POLICIES = ("drop-oldest", "skip-silence", "none")
+OVERFLOW_POLICY = "drop-oldest"
+# Захват и отправка звука в отдельном процессе (--capture-process): перевод
+# и отрисовка не задерживают отправку
+CAPTURE_PROCESS = False
+PARENT_CHECK_INTERVAL = 1.0  # секунды; процесс захвата не переживает основной
+# Пакетный режим (--batch): запись режется по паузам на куски, которые
+# распознаются параллельно по нескольким соединениям с Deepgram
+BATCH_CONNECTIONS = 4
+BATCH_PIECE_SECONDS = 120.0  # кусок закрывается на первой паузе после этого
+BATCH_MIN_SILENCE = 0.5  # секунды тишины, по которым можно резать
+# Переподключение к Deepgram
+RING_BUFFER_SECONDS = 30.0  # Сколько отправленного звука хранится для повтора
+RECONNECT_BASE_DELAY = 0.5  # секунды, удваивается с каждой неудачей
+RECONNECT_MAX_DELAY = 10.0
+RECEIVE_TIMEOUT = 10.0  # секунды без ответа на отправленный звук
+DRAIN_TIMEOUT = 5.0  # секунды ожидания последних результатов после конца звука
+DUPLICATE_TOLERANCE = 0.05  # секунды перекрытия финалов, считающиеся повтором
+# Путь к общему дисковому кэшу переводов (SQLite); пусто — только память
+TRANSLATION_CACHE_DB = os.getenv("TRANSLATION_CACHE_DB")
+CACHE_READ_TIMEOUT = 0.2  # чтение на event loop не ждёт чужую блокировку дольше
+CACHE_WRITE_TIMEOUT = 5.0  # записи идут из своего потока и могут подождать
+CACHE_FLUSH_INTERVAL = 1.0  # секунды между пачками записей в дисковый кэш
+# Месячная квота символов DeepL (у api-free — 500 000); уточняется по /v2/usage
+DEEPL_CHAR_LIMIT = int(os.getenv("DEEPL_CHAR_LIMIT", "500000"))
+# Данные, которые переживают запуск, — в каталоге пользователя, а не в текущем
+USER_DATA_DIR = os.path.join(
+    os.getenv("XDG_DATA_HOME") or os.path.expanduser("~/.local/share"), "rt_6"
+)
+# Счётчик израсходованных символов между запусками (SQLite); пусто — не хранить
+DEEPL_USAGE_DB = os.getenv(
+    "DEEPL_USAGE_DB", os.path.join(USER_DATA_DIR, "deepl_usage.sqlite3")
+)
+QUOTA_FLUSH_INTERVAL = 5.0  # секунды между записями счётчика символов на диск
+QUOTA_FEWER_INTERIMS = 0.8  # доля квоты, после которой interim переводятся реже
+QUOTA_FINALS_ONLY = 0.95  # доля квоты, после которой переводятся только финалы
+QUOTA_INTERIM_SLOWDOWN = 3  # во сколько раз реже переводятся interim
+
+
+def load_numpy():
+    global np
+    if np is not None:
+        return
+    try:
+        import numpy
+    except ImportError:  # VAD работает и без numpy, только медленнее
+        return
+    np = numpy
 
 
-def detect_pulse_monitor() -> str | None:
+async def detect_pulse_monitor() -> str | None:
+    # pactl не блокирует loop: в это время уже открывается соединение Deepgram
     try:
-        result = subprocess.run(
-            ["pactl", "info"], capture_output=True, text=True, check=True
+        process = await asyncio.create_subprocess_exec(
+            "pactl", "info", stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
         )
-        for line in result.stdout.splitlines():
+        stdout, _ = await process.communicate()
+        if process.returncode:
+            raise RuntimeError(f"pactl info exited with {process.returncode}")
+        for line in stdout.decode().splitlines():
             if line.startswith("Default Sink:"):
                 default_sink = line.split(":", 1)[1].strip()
                 return f"{default_sink}.monitor"
@@ -42,17 +186,17 @@ def detect_pulse_monitor() -> str | None:
         return None
 
 
-async def read_ffmpeg_audio():
-    monitor_source = detect_pulse_monitor()
-    if not monitor_source:
-        monitor_source = "alsa_output.pci-0000_00_1f.3.analog-stereo.monitor"
+async def read_ffmpeg_audio(input_args: list[str] | None = None):
+    """Звук через ffmpeg: по умолчанию системный звук PulseAudio"""
+    if input_args is None:
+        monitor_source = await detect_pulse_monitor()
+        if not monitor_source:
+            monitor_source = "alsa_output.pci-0000_00_1f.3.analog-stereo.monitor"
+        input_args = ["-f", "pulse", "-i", monitor_source]
 
     cmd = [
         "ffmpeg",
-        "-f",
-        "pulse",
-        "-i",
-        monitor_source,
+        *input_args,
         "-ac",
         str(CHANNELS),
         "-ar",
@@ -63,232 +207,3842 @@ async def read_ffmpeg_audio():
         "error",
         "-",
     ]
-    process = await asyncio.create_subprocess_exec(
-        *cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
-    )
-    if not process.stdout:
-        raise RuntimeError("Failed to get stdout from ffmpeg process")
+    # stdout ffmpeg — сокет: чанки читаются прямо в заранее выделенный буфер
+    reader, writer = socket.socketpair()
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *cmd, stdout=writer, stderr=subprocess.DEVNULL
+        )
+    finally:
+        writer.close()
+    reader.setblocking(False)
+    loop = asyncio.get_running_loop()
+
+    try:
+        async for chunk in read_chunks(lambda view: loop.sock_recv_into(reader, view)):
+            yield chunk
+    finally:
+        reader.close()
+        # Корректно завершаем процесс ffmpeg
+        if process.returncode is None:
+            process.terminate()
+            await process.wait()
 
+
+async def read_chunks(readinto):
+    """Чанки по CHUNK_SIZE из ``readinto`` в одном заранее выделенном буфере.
+
+    Выдаётся memoryview этого буфера, он действителен до запроса следующего
+    чанка: всё, что хранится дольше, копируется (в кольцевой буфер).
+    """
+    buffer = memoryview(bytearray(CHUNK_SIZE))
     while True:
-        data = await process.stdout.read(CHUNK_SIZE)
-        if not data:
-            break
-        yield data
+        filled = 0
+        while filled < CHUNK_SIZE:
+            count = await readinto(buffer[filled:])
+            if not count:
+                break
+            filled += count
+        if not filled:
+            return
+        yield buffer[:filled]
+
+
+async def read_pipe_audio(file):
+    """Сырой s16le из канала (stdin, именованный канал) без блокировки loop"""
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    transport, _ = await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), file
+    )
+    try:
+        while True:
+            try:
+                yield await reader.readexactly(CHUNK_SIZE)
+            except asyncio.IncompleteReadError as e:
+                if e.partial:
+                    yield e.partial
+                break
+    finally:
+        transport.close()
+
+
+async def read_fifo_audio(path: str):
+    """Именованный канал по пути.
+
+    open() канала ждёт, пока появится писатель, поэтому он идёт в отдельном
+    потоке — daemon, чтобы выход не ждал писателя, который так и не пришёл.
+    """
+    loop = asyncio.get_running_loop()
+    opened = loop.create_future()
+
+    def deliver(result):
+        if opened.done():  # ожидание уже отменено
+            if not isinstance(result, OSError):
+                result.close()
+        elif isinstance(result, OSError):
+            opened.set_exception(result)
+        else:
+            opened.set_result(result)
+
+    def open_fifo():
+        try:
+            result = open(path, "rb", buffering=0)
+        except OSError as e:
+            result = e
+        try:
+            loop.call_soon_threadsafe(deliver, result)
+        except RuntimeError:
+            pass  # event loop уже закрыт
+
+    threading.Thread(target=open_fifo, name="rt_6-fifo-open", daemon=True).start()
+    async for chunk in read_pipe_audio(await opened):
+        yield chunk
+
+
+async def read_file_audio(file):
+    """Сырой s16le из обычного файла"""
+    try:
+        async for chunk in read_chunks(
+            lambda view: asyncio.to_thread(file.readinto, view)
+        ):
+            yield chunk
+    finally:
+        file.close()
+
+
+async def read_pcm_range(path: str, start: int, end: int):
+    """Сырой s16le из куска файла: байты [start, end)"""
+    file = open(path, "rb")
+    file.seek(start)
+    left = end - start
+
+    async def readinto(view: memoryview) -> int:
+        nonlocal left
+        count = await asyncio.to_thread(file.readinto, view[:left]) if left else 0
+        left -= count or 0
+        return count
+
+    try:
+        async for chunk in read_chunks(readinto):
+            yield chunk
+    finally:
+        file.close()
+
+
+async def read_wav_audio(wav: wave.Wave_read):
+    """Кадры WAV, уже совпадающего по формату с потоком Deepgram"""
+    frames = CHUNK_SIZE // FRAME_SIZE
+    try:
+        while True:
+            data = await asyncio.to_thread(wav.readframes, frames)
+            if not data:
+                break
+            yield data
+    finally:
+        wav.close()
+
+
+class AudioEncoder:
+    """Сжатие PCM для одного соединения Deepgram через ffmpeg.
+
+    Ogg/Opus и FLAC — потоки с заголовком, поэтому на каждое соединение
+    (и каждый повтор после переподключения) запускается свой кодер.
+    Сжатые данные отправляются по мере выхода из ffmpeg через ``send``.
+    """
+
+    CODEC_ARGS = {
+        "opus": [
+            "-c:a",
+            "libopus",
+            "-b:a",
+            OPUS_BITRATE,
+            "-application",
+            "voip",
+            "-frame_duration",
+            "20",
+            "-f",
+            "ogg",
+            "-page_duration",
+            "20000",  # мкс: страница Ogg на каждый кадр, без накопления
+        ],
+        "flac": [
+            "-c:a",
+            "flac",
+            "-frame_size",
+            str(int(SAMPLE_RATE * CHUNK_DURATION)),  # кадр FLAC = чанк
+            "-f",
+            "flac",
+        ],
+    }
+
+    def __init__(self, codec: str, send):
+        self.codec = codec
+        self.send = send
+        self.process: asyncio.subprocess.Process | None = None
+        self.pump_task: asyncio.Task | None = None
+        self.error: Exception | None = None
+        self.encoded_bytes = 0
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(
+            "ffmpeg",
+            "-loglevel",
+            "error",
+            "-f",
+            "s16le",
+            "-ar",
+            str(SAMPLE_RATE),
+            "-ac",
+            str(CHANNELS),
+            "-i",
+            "-",
+            *self.CODEC_ARGS[self.codec],
+            "-flush_packets",
+            "1",
+            "-",
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self.pump_task = asyncio.create_task(self.pump())
+
+    async def pump(self):
+        assert self.process and self.process.stdout
+        try:
+            while data := await self.process.stdout.read(4096):
+                await self.send(data)
+                self.encoded_bytes += len(data)
+        except Exception as e:
+            self.error = e
+
+    async def write(self, pcm: bytes | memoryview):
+        if self.error:
+            raise self.error
+        assert self.process and self.process.stdin
+        self.process.stdin.write(pcm)
+        await self.process.stdin.drain()
+
+    async def finish(self):
+        """Закрыть вход кодера и дождаться отправки последних данных"""
+        assert self.process and self.process.stdin and self.pump_task
+        self.process.stdin.close()
+        await asyncio.wait_for(asyncio.shield(self.pump_task), DRAIN_TIMEOUT)
+        if self.error:
+            raise self.error
+
+    async def close(self):
+        if self.pump_task:
+            self.pump_task.cancel()
+            await asyncio.gather(self.pump_task, return_exceptions=True)
+        if self.process and self.process.returncode is None:
+            self.process.kill()
+            await self.process.wait()
+
+
+def open_audio_source(source: str):
+    """Источник звука по описанию из командной строки.
+
+    ``pulse`` — системный звук, ``-`` — s16le из stdin, путь к именованному
+    каналу — s16le из канала, ``.raw``/``.pcm``/``.s16le`` — сырой файл,
+    WAV 16 кГц mono 16 бит читается напрямую, остальное декодирует ffmpeg.
+    """
+    if source == "pulse":
+        return read_ffmpeg_audio()
+    if source == "-":
+        if stat.S_ISREG(os.fstat(sys.stdin.fileno()).st_mode):
+            return read_file_audio(sys.stdin.buffer)
+        return read_pipe_audio(sys.stdin.buffer)
+    if stat.S_ISFIFO(os.stat(source).st_mode):
+        return read_fifo_audio(source)
+    if source.lower().endswith((".raw", ".pcm", ".s16le")):
+        return read_file_audio(open(source, "rb"))
+    if source.lower().endswith(".wav"):
+        wav = wave.open(source, "rb")
+        params = (wav.getnchannels(), wav.getsampwidth(), wav.getframerate())
+        if params == (CHANNELS, 2, SAMPLE_RATE):
+            return read_wav_audio(wav)
+        wav.close()
+    # Прочие форматы и WAV с другой частотой приводит к s16le ffmpeg
+    return read_ffmpeg_audio(["-i", source])
+
+
+async def pace_audio(audio, speed: float | None):
+    """Выдаёт звук в темпе ``speed`` × реальное время; None — без ограничений"""
+    started = time.monotonic()
+    position = 0
+    async for chunk in audio:
+        position += len(chunk)
+        if speed is None:
+            await asyncio.sleep(0)  # даём поработать остальным задачам
+        else:
+            due = started + position / BYTES_PER_SECOND / speed
+            await asyncio.sleep(max(0.0, due - time.monotonic()))
+        yield chunk
+
+
+def parse_source(value: str) -> str:
+    if value not in ("pulse", "-") and not os.path.exists(value):
+        raise argparse.ArgumentTypeError(f"no such file or pipe: {value}")
+    return value
+
+
+def parse_output(value: str) -> str:
+    if os.path.splitext(value)[1].lower() not in SINK_FORMATS:
+        raise argparse.ArgumentTypeError(
+            f"unsupported subtitle format, use one of {', '.join(SINK_FORMATS)}"
+        )
+    return value
+
+
+def stream_offset(seconds: float) -> int:
+    """Позиция в PCM-потоке (байты) для секунд, вниз до целого сэмпла.
+
+    Deepgram отдаёт ``start``/``duration`` дробными: с нечётной позиции
+    повтор после переподключения шёл бы со сдвигом на байт, то есть шумом.
+    """
+    offset = int(seconds * BYTES_PER_SECOND)
+    return offset - offset % FRAME_SIZE
+
+
+def tagged_path(path: str, tag: str) -> str:
+    """out.srt -> out.<tag>.srt"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{tag}{ext}"
+
+
+def parse_pace(value: str) -> float | None:
+    if value == "realtime":
+        return 1.0
+    if value == "fast":
+        return None
+    speed = float(value)
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("pace must be positive")
+    return speed
+
+
+class VoiceActivityGate:
+    """Энергетический VAD для чанков s16le.
+
+    Чанк считается речью, если его RMS выше порога, либо RMS выше половины
+    порога при низкой доле пересечений нуля (тихие вокализованные звуки).
+    После речи ещё ``hangover`` секунд отправляются без проверки, чтобы
+    Deepgram успел закрыть фразу по endpointing; последние ``preroll``
+    секунд тишины уходят вместе с началом речи.
+    """
+
+    def __init__(
+        self,
+        energy_threshold: float = VAD_ENERGY_THRESHOLD,
+        zcr_max: float = VAD_ZCR_MAX,
+        hangover: float = VAD_HANGOVER,
+        preroll: float = VAD_PREROLL,
+    ):
+        self.energy_threshold = energy_threshold
+        self.zcr_max = zcr_max
+        self.hangover_chunks = round(hangover / CHUNK_DURATION)
+        # Тишина перед речью копится в своём буфере: входные чанки — окна
+        # общего буфера чтения, хранить их самих нельзя
+        self.preroll = PcmRingBuffer(round(preroll / CHUNK_DURATION) * CHUNK_SIZE)
+        self.preroll_start = 0
+        self.hangover_left = 0
+        self.captured_bytes = 0
+        self.sent_bytes = 0
+        self.suppressed_bytes = 0
+        self.suppressing = False
+        # Точки (отправлено байт, захвачено байт), где поток возобновлялся
+        # после паузы: по ним время Deepgram переводится во время захвата
+        self.timeline: list[tuple[int, int]] = [(0, 0)]
+
+    @staticmethod
+    def measure(chunk: bytes) -> tuple[float, float]:
+        """RMS и доля пересечений нуля"""
+        if np is not None:
+            samples = np.frombuffer(chunk, dtype="<i2").astype(np.float32)
+            if samples.size < 2:
+                return 0.0, 0.0
+            rms = float(np.sqrt(np.mean(samples * samples)))
+            signs = np.signbit(samples)
+            zcr = float(np.count_nonzero(signs[1:] != signs[:-1])) / samples.size
+            return rms, zcr
+
+        samples = array.array("h")
+        samples.frombytes(chunk[: len(chunk) - len(chunk) % 2])
+        if sys.byteorder == "big":
+            samples.byteswap()
+        if len(samples) < 2:
+            return 0.0, 0.0
+        rms = math.sqrt(sum(x * x for x in samples) / len(samples))
+        crossings = sum(1 for a, b in zip(samples, samples[1:]) if (a < 0) != (b < 0))
+        return rms, crossings / len(samples)
+
+    def is_speech(self, chunk: bytes) -> bool:
+        rms, zcr = self.measure(chunk)
+        if rms >= self.energy_threshold:
+            return True
+        return rms >= self.energy_threshold / 2 and zcr <= self.zcr_max
+
+    def process(self, chunk: bytes, strict: bool = False) -> list[bytes]:
+        """Вернуть чанки, которые нужно отправить (пусто — тишина).
+
+        ``strict`` — отправлять только саму речь, без hangover и preroll
+        (очередь на отправку переполнена).
+        """
+        captured_at = self.captured_bytes
+        self.captured_bytes += len(chunk)
+
+        if self.is_speech(chunk):
+            self.hangover_left = self.hangover_chunks
+        elif self.hangover_left > 0 and not strict:
+            self.hangover_left -= 1
+        else:
+            self.hangover_left = 0
+            held = self.preroll.end - max(self.preroll_start, self.preroll.start)
+            overflow = held + len(chunk) - self.preroll.capacity
+            self.suppressed_bytes += max(0, overflow)
+            self.preroll.write(chunk)
+            self.suppressing = True
+            return []
+
+        out = [chunk]
+        if self.suppressing:
+            start = max(self.preroll_start, self.preroll.start)
+            if strict:
+                self.suppressed_bytes += self.preroll.end - start
+                start = self.preroll.end
+            self.timeline.append(
+                (self.sent_bytes, captured_at - (self.preroll.end - start))
+            )
+            out = []
+            while start < self.preroll.end:
+                out.append(self.preroll.read(start, self.preroll.end - start))
+                start += len(out[-1])
+            out.append(chunk)
+            self.preroll_start = self.preroll.end
+            self.suppressing = False
+        self.sent_bytes += sum(len(c) for c in out)
+        return out
+
+    def to_capture_time(self, sent_seconds: float) -> float:
+        """Перевести время потока Deepgram во время захвата звука"""
+        sent = sent_seconds * BYTES_PER_SECOND
+        index = bisect.bisect_right(self.timeline, (sent, math.inf)) - 1
+        sent_at, captured_at = self.timeline[max(index, 0)]
+        return (captured_at + sent - sent_at) / BYTES_PER_SECOND
+
+    @property
+    def suppressed_fraction(self) -> float:
+        if not self.captured_bytes:
+            return 0.0
+        return self.suppressed_bytes / self.captured_bytes
+
+
+class PcmRingBuffer:
+    """Кольцевой буфер звука фиксированного размера.
+
+    Позиции абсолютные — число байт, записанных с начала сессии. Хранятся
+    последние ``capacity`` байт; более старые перезаписываются.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.buffer = bytearray(capacity)
+        self.end = 0
+
+    @property
+    def start(self) -> int:
+        return max(0, self.end - self.capacity)
+
+    def write(self, data: bytes):
+        if not self.capacity:
+            self.end += len(data)
+            return
+        data = memoryview(data)[-self.capacity :]
+        pos = self.end % self.capacity
+        first = min(len(data), self.capacity - pos)
+        self.buffer[pos : pos + first] = data[:first]
+        self.buffer[: len(data) - first] = data[first:]
+        self.end += len(data)
+
+    def read(self, offset: int, max_bytes: int) -> memoryview:
+        """Непрерывный кусок начиная с ``offset`` (не длиннее max_bytes)"""
+        offset = max(offset, self.start)
+        pos = offset % self.capacity
+        size = min(max_bytes, self.end - offset, self.capacity - pos)
+        return memoryview(self.buffer)[pos : pos + size]
+
+
+class InterimStabilityTracker:
+    """Отслеживает стабильный префикс interim-гипотез текущей фразы.
+
+    Стабильный префикс — общие начальные слова двух последних гипотез.
+    Перевод нужен, когда префикс вырос на ``min_growth`` слов с момента
+    прошлого запроса или прошло ``debounce`` секунд.
+    """
 
+    def __init__(
+        self,
+        min_growth: int = INTERIM_MIN_STABLE_GROWTH,
+        debounce: float = INTERIM_DEBOUNCE,
+    ):
+        self.min_growth = min_growth
+        self.debounce = debounce
+        self.slowdown = 1  # > 1 — квота DeepL на исходе, переводим реже
+        self.reset()
+
+    def reset(self):
+        self.previous_words: list[str] = []
+        self.requested_words: list[str] = []
+        self.stable_len = 0
+        self.requested_stable_len = 0
+        self.last_request_time: float | None = None
+
+    @staticmethod
+    def split_words(transcript: str) -> list[str]:
+        return re.findall(r"[\w']+", transcript.lower())
+
+    def update(self, transcript: str, now: float) -> bool:
+        """Учесть новую гипотезу; True — её стоит переводить сейчас"""
+        words = self.split_words(transcript)
+        stable = 0
+        for old, new in zip(self.previous_words, words):
+            if old != new:
+                break
+            stable += 1
+        self.previous_words = words
+        self.stable_len = stable
+
+        if words == self.requested_words:
+            return False
+        if self.last_request_time is None:
+            return True
+        growth = self.stable_len - self.requested_stable_len
+        if growth >= self.min_growth * self.slowdown:
+            return True
+        return now - self.last_request_time >= self.debounce * self.slowdown
+
+    def is_requested(self, transcript: str) -> bool:
+        return self.split_words(transcript) == self.requested_words
+
+    def mark_requested(self, now: float):
+        self.requested_words = self.previous_words
+        self.requested_stable_len = self.stable_len
+        self.last_request_time = now
+
+    def time_until_due(self, now: float) -> float:
+        """Сколько ждать до перевода по debounce"""
+        if self.last_request_time is None:
+            return 0.0
+        return max(0.0, self.last_request_time + self.debounce * self.slowdown - now)
+
+
+@dataclass
+class TranscriptSegment:
+    """Результат Deepgram на пути к экрану с отметками времени стадий.
+
+    Отметки — ``time.monotonic()``; ``start``/``end`` — секунды потока сессии.
+    """
+
+    seq: int
+    transcript: str
+    is_final: bool
+    start: float
+    end: float
+    received_at: float
+    captured_at: float | None = None
+    sent_at: float | None = None
+    utterance: int = 0
+    target_lang: str | None = None
+    translate_started_at: float | None = None
+    translated_at: float | None = None
+    shown_at: float | None = None
+
+
+@dataclass
+class Speculation:
+    """Перевод interim, начатый до финала в расчёте на совпадение текста"""
+
+    normalized: str
+    context: str
+    utterance: int
+    chars: int
+    started_at: float
+    task: asyncio.Task
+
+
+class Timeline:
+    """Соответствие позиции в потоке (байты) моменту времени.
+
+    Хранит точки за последние ``RING_BUFFER_SECONDS``: для поиска момента,
+    когда был захвачен или отправлен звук, на который ответил Deepgram.
+    """
+
+    def __init__(self, max_points: int = int(RING_BUFFER_SECONDS / CHUNK_DURATION)):
+        self.max_points = max_points
+        self.positions: list[int] = []
+        self.times: list[float] = []
+
+    def add(self, position: int, moment: float):
+        self.positions.append(position)
+        self.times.append(moment)
+        if len(self.positions) > 2 * self.max_points:
+            del self.positions[: self.max_points]
+            del self.times[: self.max_points]
+
+    def time_at(self, position: int) -> float | None:
+        """Момент, когда поток дошёл до ``position``"""
+        index = bisect.bisect_left(self.positions, position)
+        if index == len(self.positions):
+            return None
+        return self.times[index]
+
+    def truncate_after(self, position: int):
+        """Забыть точки после ``position`` (звук будет отправлен повторно)"""
+        index = bisect.bisect_right(self.positions, position)
+        del self.positions[index:]
+        del self.times[index:]
+
+
+class LatencyHistogram:
+    """Гистограмма задержек с логарифмическими корзинами от 1 мс до ~80 с"""
+
+    BOUNDS = [0.001 * 1.25**i for i in range(51)]
 
-class RealTimeSubtitles:
     def __init__(self):
-        self.session_active = False
-        self.websocket = None
-        self.final_buffer: deque[str] = deque(maxlen=CONTEXT_WINDOW)
-        self.partial_buffer = ""
-        self.last_interim_len = 0
-        self.initialized = False
-        self.translation_cache: dict[str, str] = {}
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
 
-        # Персистентный HTTP клиент для DeepL
-        self.http_client = httpx.AsyncClient(
-            timeout=httpx.Timeout(3.0, connect=2.0),
-            limits=httpx.Limits(max_keepalive_connections=5, max_connections=10),
+    def add(self, seconds: float):
+        seconds = max(0.0, seconds)
+        self.counts[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q: float) -> float:
+        """Верхняя граница корзины, в которую попадает квантиль ``q``"""
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(self.BOUNDS[min(index, len(self.BOUNDS) - 1)], self.max)
+        return self.max
+
+
+class LatencyTracker:
+    """Задержки по стадиям для показанных субтитров.
+
+    Стадии: захват → отправка в websocket → результат Deepgram → запрос
+    перевода → ответ DeepL → вывод на экран. Итог печатается при выходе;
+    при заданном ``trace_path`` каждая запись пишется строкой JSONL.
+    """
+
+    STAGES = [
+        ("capture_to_send", "captured_at", "sent_at"),
+        ("send_to_result", "sent_at", "received_at"),
+        ("result_to_translate", "received_at", "translate_started_at"),
+        ("translation", "translate_started_at", "translated_at"),
+        ("translate_to_display", "translated_at", "shown_at"),
+        ("end_to_end", "captured_at", "shown_at"),
+    ]
+
+    def __init__(self, trace_path: str | None = None, session: str | None = None):
+        self.session = session
+        # "final RU" -> стадия -> гистограмма; языки появляются по мере записи
+        self.histograms: dict[str, dict[str, LatencyHistogram]] = {}
+        # Построчная буферизация: сессии одного процесса пишут в общий файл
+        self.trace = (
+            open(trace_path, "a", encoding="utf-8", buffering=1) if trace_path else None
         )
+        self.origin = time.monotonic()
+        self.first: TranscriptSegment | None = None  # первый показанный субтитр
 
-        # Счетчик для управления кэшем
-        self.cache_counter = 0
+    def record(self, segment: TranscriptSegment, translated: str):
+        if self.first is None:
+            self.first = segment
+        kind = "final" if segment.is_final else "interim"
+        label = f"{kind} {segment.target_lang}" if segment.target_lang else kind
+        histograms = self.histograms.get(label)
+        if histograms is None:
+            histograms = {stage: LatencyHistogram() for stage, _, _ in self.STAGES}
+            self.histograms[label] = histograms
+        stages = {}
+        for stage, begin, end in self.STAGES:
+            began, ended = getattr(segment, begin), getattr(segment, end)
+            if began is not None and ended is not None:
+                histograms[stage].add(ended - began)
+                stages[stage] = round((ended - began) * 1000, 1)
 
-    def normalize_text(self, text: str) -> str:
-        """Нормализация текста для улучшения кэширования"""
-        # Убираем лишние пробелы
-        normalized = re.sub(r"\s+", " ", text.strip())
-        # Убираем завершающую пунктуацию для совпадения interim/final
-        normalized = re.sub(r"[.!?,;]+$", "", normalized)
-        return normalized.lower()
+        if self.trace:
+            record = {
+                key: (
+                    round((value - self.origin) * 1000, 1)
+                    if key.endswith("_at") and value is not None
+                    else value
+                )
+                for key, value in asdict(segment).items()
+            }
+            record.update(
+                session=self.session,
+                kind=kind,
+                translation=translated,
+                stages_ms=stages,
+            )
+            self.trace.write(json.dumps(record, ensure_ascii=False) + "\n")
 
-    def redraw(self, text: str | None = None, is_final: bool = False):
-        if not self.initialized:
-            os.system("clear")
-            print("Deepgram connection established")
-            self.initialized = True
+    def print_summary(self):
+        for label, histograms in sorted(self.histograms.items()):
+            if not histograms["end_to_end"].count:
+                continue
+            print(
+                f"[Latency] {label + ' (ms):':<24} {'count':>5} "
+                f"{'p50':>7} {'p90':>7} {'p99':>7} {'max':>7}"
+            )
+            for stage, histogram in histograms.items():
+                if not histogram.count:
+                    continue
+                print(
+                    f"[Latency]   {stage:<22} {histogram.count:>5} "
+                    + " ".join(
+                        f"{histogram.percentile(q) * 1000:>7.0f}"
+                        for q in (0.5, 0.9, 0.99)
+                    )
+                    + f" {histogram.max * 1000:>7.0f}"
+                )
 
-        if is_final and text:
-            sys.stdout.write("\r" + " " * self.last_interim_len + "\r")
-            sys.stdout.flush()
-            print(text)
-            self.last_interim_len = 0
-        elif text:
-            sys.stdout.write("\r" + " " * self.last_interim_len + "\r")
-            sys.stdout.write(text)
-            sys.stdout.flush()
-            self.last_interim_len = len(text)
+    def close(self):
+        if self.trace:
+            self.trace.close()
+            self.trace = None
 
-    def print_interim(self, text: str):
-        self.partial_buffer = text
-        self.redraw(text=text, is_final=False)
 
-    def print_final(self, text: str):
-        if text and text not in self.final_buffer:
-            self.final_buffer.append(text)
-            self.redraw(text=text, is_final=True)
-            self.partial_buffer = ""
+class LRUCache:
+    """Ограниченный кэш с LRU-вытеснением за O(1) и опциональным TTL.
 
-    def get_context(self) -> str:
-        """Получить контекст из предыдущих финальных фраз"""
-        if len(self.final_buffer) == 0:
-            return ""
-        return " ".join(list(self.final_buffer))
+    Размер ограничен и числом записей, и оценкой занимаемой памяти.
+    Счётчики попаданий, промахов и вытеснений доступны через ``stats()``.
+    """
 
-    def manage_cache(self):
-        """Управление размером кэша"""
-        if len(self.translation_cache) > MAX_CACHE_SIZE:
-            # Удаляем старые 50 записей
-            for _ in range(50):
-                if self.translation_cache:
-                    self.translation_cache.pop(next(iter(self.translation_cache)))
+    def __init__(
+        self,
+        max_entries: int = MAX_CACHE_SIZE,
+        max_bytes: int = MAX_CACHE_BYTES,
+        ttl: float | None = CACHE_TTL,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # key -> (value, expires_at, size)
+        self.entries: OrderedDict[str, tuple[str, float | None, int]] = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
 
-    async def translate_text(self, text: str, is_final: bool = False) -> str:
-        text = text.strip()
-        if not text:
-            return ""
+    def __len__(self) -> int:
+        return len(self.entries)
 
-        # Проверка кэша с нормализацией
-        cache_key = self.normalize_text(text)
-        if cache_key in self.translation_cache:
-            return self.translation_cache[cache_key]
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
 
-        url = "https://api-free.deepl.com/v2/translate"
-        headers = {
-            "Authorization": f"DeepL-Auth-Key {DEEPL_API_KEY}",
-            "User-Agent": "sub_realtime_translator/2.0",
-            "Content-Type": "application/x-www-form-urlencoded",
-        }
+    def get(self, key: str, count: bool = True) -> str | None:
+        """Значение по ключу; ``count=False`` — без учёта в hits/misses"""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += count
+            return None
+        value, expires_at, _ = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            self.remove(key)
+            self.expirations += 1
+            self.misses += count
+            return None
+        self.entries.move_to_end(key)
+        self.hits += count
+        return value
 
-        # Базовые параметры перевода
-        data = {
-            "text": text,
-            "target_lang": "RU",
-            "source_lang": TRANSLATION_LANG,
-            "split_sentences": "0",  # Не разбивать на предложения
-            "preserve_formatting": "1",  # Сохранять форматирование
+    def put(self, key: str, value: str):
+        if key in self.entries:
+            self.remove(key)
+        size = sys.getsizeof(key) + sys.getsizeof(value)
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        self.entries[key] = (value, expires_at, size)
+        self.bytes += size
+        while self.entries and (
+            len(self.entries) > self.max_entries or self.bytes > self.max_bytes
+        ):
+            _, (_, _, evicted_size) = self.entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def remove(self, key: str):
+        _, _, size = self.entries.pop(key)
+        self.bytes -= size
+
+    def stats(self) -> dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
         }
 
-        # Добавляем контекст для финальных результатов
-        if is_final:
-            context = self.get_context()
-            if context:
-                data["context"] = context
 
-        try:
-            response = await self.http_client.post(url, headers=headers, data=data)
-            response.raise_for_status()
-            result = response.json()
-            translated = result["translations"][0]["text"]
+def word_distance(a: tuple[str, ...], b: tuple[str, ...], limit: int) -> int:
+    """Расстояние Левенштейна по словам; больше ``limit`` — ``limit + 1``"""
+    previous = list(range(len(b) + 1))
+    for i, word in enumerate(a, 1):
+        current = [i]
+        for j, other in enumerate(b, 1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (word != other),
+                )
+            )
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return min(previous[-1], limit + 1)
 
-            # Кэшируем результат
-            self.translation_cache[cache_key] = translated
 
-            # Управление размером кэша каждые 15 переводов
-            self.cache_counter += 1
-            if self.cache_counter % 15 == 0:
-                self.manage_cache()
+class FuzzyTranslationIndex:
+    """Приближённый поиск почти одинаковых транскриптов в кэше переводов.
 
-            return translated
+    Текст сводится к словам без пунктуации и слов-паразитов. Совпадение
+    такой формы ищется по словарю, близкие тексты — по общим словам
+    (инвертированный индекс) с проверкой пословного расстояния Левенштейна,
+    пока не исчерпан ``budget``. Индекс хранит только ключи: перевод берётся
+    из LRU-кэша, а вытесненные оттуда ключи удаляются при поиске.
+    """
 
-        except httpx.TimeoutException:
-            return text
-        except httpx.HTTPStatusError as e:
-            if e.response.status_code == 429:  # Rate limit
-                await asyncio.sleep(0.3)
-            return text
-        except Exception as e:
-            print(f"[Translation error]: {e}")
-            return text
+    def __init__(
+        self, max_entries: int = MAX_CACHE_SIZE, budget: float = FUZZY_LOOKUP_BUDGET
+    ):
+        self.max_entries = max_entries
+        self.budget = budget
+        # ключ кэша -> (язык, слова)
+        self.entries: OrderedDict[str, tuple[str, tuple[str, ...]]] = OrderedDict()
+        self.canonical: dict[tuple[str, tuple[str, ...]], str] = {}
+        self.postings: dict[tuple[str, str], set[str]] = {}  # (язык, слово) -> ключи
+        self.lookups = 0
+        self.canonical_hits = 0
+        self.near_hits = 0
+        self.over_budget = 0
 
-    async def process_audio_stream(self):
-        self.session_active = True
-        receive_task: asyncio.Task | None = None
+    @staticmethod
+    def words(text: str) -> tuple[str, ...]:
+        return tuple(
+            word
+            for word in re.findall(r"[\w']+", text.lower())
+            if word not in FILLER_WORDS
+        )
 
-        try:
-            # Правильные параметры Deepgram API
-            async with websocket_connect(
-                "wss://api.deepgram.com/v1/listen"
-                "?encoding=linear16&sample_rate=16000&channels=1"
-                f"&model=nova-2&language={TRANSLATION_LANG}"
-                "&punctuate=true&interim_results=true"
-                "&endpointing=300&smart_format=true",
-                extra_headers={"Authorization": f"Token {DEEPGRAM_API_KEY}"},
-                ping_interval=10,
-                ping_timeout=30,
-            ) as ws:
-                self.websocket = ws
-
-                receive_task = asyncio.create_task(self.receive_results(ws))
+    def add(self, lang: str, cache_key: str, text: str):
+        if cache_key in self.entries:
+            self.entries.move_to_end(cache_key)
+            return
+        words = self.words(text)
+        if not words:
+            return
+        self.entries[cache_key] = (lang, words)
+        self.canonical[(lang, words)] = cache_key
+        for word in set(words):
+            self.postings.setdefault((lang, word), set()).add(cache_key)
+        while len(self.entries) > self.max_entries:
+            self.remove(next(iter(self.entries)))
 
-                try:
-                    async for chunk in read_ffmpeg_audio():
-                        try:
-                            await ws.send(chunk)
-                        except Exception as e:
-                            print(f"Send error: {e}")
-                            break
-                finally:
-                    self.session_active = False
-                    if receive_task and not receive_task.done():
-                        receive_task.cancel()
-                        try:
-                            await receive_task
-                        except asyncio.CancelledError:
-                            pass
+    def remove(self, cache_key: str):
+        lang, words = self.entries.pop(cache_key)
+        if self.canonical.get((lang, words)) == cache_key:
+            del self.canonical[(lang, words)]
+        for word in set(words):
+            keys = self.postings[(lang, word)]
+            keys.discard(cache_key)
+            if not keys:
+                del self.postings[(lang, word)]
 
-                    try:
-                        await ws.send(json.dumps({"type": "CloseStream"}))
-                    except Exception:
-                        pass
+    def fetch(self, cache_key: str, cache: LRUCache) -> str | None:
+        # Пробы не учитываются в hits/misses LRU: у поиска свои счётчики
+        value = cache.get(cache_key, count=False)
+        if value is None:
+            self.remove(cache_key)  # запись вытеснена из кэша
+        return value
 
-        except Exception as e:
-            print(f"Connection error: {e}")
-        finally:
-            self.session_active = False
-            await self.http_client.aclose()
+    def lookup(
+        self, lang: str, text: str, max_distance: float, cache: LRUCache
+    ) -> str | None:
+        """Перевод почти такого же текста из LRU-кэша ``cache``"""
+        started = time.perf_counter()
+        self.lookups += 1
+        words = self.words(text)
+        if not words:
+            return None
+        cache_key = self.canonical.get((lang, words))
+        if cache_key is not None:
+            found = self.fetch(cache_key, cache)
+            if found is not None:
+                self.canonical_hits += 1
+                return found
 
-    async def receive_results(self, ws):
-        while self.session_active:
+        limit = int(max_distance * len(words))  # допустимо правок слов
+        if not limit:
+            return None
+        unique = set(words)
+        shared: Counter[str] = Counter()
+        for word in unique:
+            shared.update(self.postings.get((lang, word), ()))
+        for cache_key, count in shared.most_common():
+            if count < len(unique) - limit:
+                break  # у остальных ещё меньше общих слов
+            if time.perf_counter() - started > self.budget:
+                self.over_budget += 1
+                break
+            other = self.entries[cache_key][1]
+            if abs(len(other) - len(words)) > limit:
+                continue
+            if word_distance(words, other, limit) <= limit:
+                found = self.fetch(cache_key, cache)
+                if found is not None:
+                    self.near_hits += 1
+                    return found
+        return None
+
+
+class PersistentTranslationCache:
+    """Дисковый кэш переводов в SQLite (WAL).
+
+    Несколько процессов на одном хосте читают и пишут одну базу
+    одновременно. Чтение идёт на event loop: в WAL оно не ждёт писателей,
+    а соединение открывается при первом обращении. Записи копятся и раз в
+    ``flush_interval`` уходят одной транзакцией из отдельного потока, так
+    что чужая блокировка не задерживает субтитры. Первая ошибка печатается,
+    остальные только считаются.
+    """
+
+    def __init__(self, path: str, flush_interval: float = CACHE_FLUSH_INTERVAL):
+        self.path = path
+        self.conn: sqlite3.Connection | None = None
+        self.disabled = False
+        self.hits = 0
+        self.errors = 0
+        self.flush_interval = flush_interval
+        self.condition = threading.Condition()
+        self.pending: list[tuple[str, str, str, str]] = []
+        self.closed = False
+        self.thread: threading.Thread | None = None
+
+    def open(self, timeout: float) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path, timeout=timeout, isolation_level=None, check_same_thread=False
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS translations ("
+            " source_lang TEXT NOT NULL,"
+            " target_lang TEXT NOT NULL,"
+            " text TEXT NOT NULL,"
+            " translation TEXT NOT NULL,"
+            " PRIMARY KEY (source_lang, target_lang, text)"
+            ") WITHOUT ROWID"
+        )
+        return conn
+
+    def connect(self) -> sqlite3.Connection | None:
+        if self.conn is None and not self.disabled:
             try:
-                result = await asyncio.wait_for(ws.recv(), timeout=10)
-                data = json.loads(result)
+                self.conn = self.open(CACHE_READ_TIMEOUT)
+            except sqlite3.Error as e:
+                self.error(e)
+                self.disabled = True
+        return self.conn
 
-                if "channel" in data:
-                    transcript = data["channel"]["alternatives"][0]["transcript"]
-                    if not transcript.strip():
-                        continue
+    def error(self, e: sqlite3.Error):
+        self.errors += 1
+        if self.errors == 1:
+            print(f"[Cache error]: {e} (further errors are only counted)")
 
-                    is_final = data.get("is_final", False)
+    def get(self, source_lang: str, target_lang: str, text: str) -> str | None:
+        conn = self.connect()
+        if conn is None:
+            return None
+        try:
+            row = conn.execute(
+                "SELECT translation FROM translations"
+                " WHERE source_lang = ? AND target_lang = ? AND text = ?",
+                (source_lang, target_lang, text),
+            ).fetchone()
+        except sqlite3.Error as e:
+            self.error(e)
+            return None
+        if row is None:
+            return None
+        self.hits += 1
+        return row[0]
+
+    def put(self, source_lang: str, target_lang: str, text: str, translation: str):
+        if self.disabled:
+            return
+        with self.condition:
+            self.pending.append((source_lang, target_lang, text, translation))
+        if self.thread is None:
+            self.thread = threading.Thread(
+                target=self.run, name="cache-writer", daemon=True
+            )
+            self.thread.start()
 
-                    # Переводим с контекстом для финальных результатов
-                    translated = await self.translate_text(
-                        transcript, is_final=is_final
+    def run(self):
+        conn: sqlite3.Connection | None = None
+        while True:
+            with self.condition:
+                if not self.closed:
+                    self.condition.wait(self.flush_interval)
+                rows, self.pending = self.pending, []
+                closed = self.closed
+            if rows:
+                try:
+                    conn = conn or self.open(CACHE_WRITE_TIMEOUT)
+                    conn.execute("BEGIN")
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?)",
+                        rows,
                     )
+                    conn.execute("COMMIT")
+                except sqlite3.Error as e:
+                    # База занята другим процессом — пачка теряется, кэш не критичен
+                    self.error(e)
+                    if conn is not None and conn.in_transaction:
+                        conn.rollback()
+            if closed:
+                if conn is not None:
+                    conn.close()
+                return
 
-                    if is_final:
-                        self.print_final(translated)
-                    else:
-                        self.print_interim(translated)
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join(timeout=CACHE_WRITE_TIMEOUT + 1.0)
+            self.thread = None
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
 
-            except asyncio.TimeoutError:
-                print("Timeout waiting for Deepgram response")
-                break
-            except asyncio.CancelledError:
-                break
-            except Exception as e:
-                print(f"Receive error: {e}")
-                break
+
+class DeepLQuota:
+    """Учёт оплачиваемых символов DeepL и экономия месячной квоты.
+
+    Символы считаются по успешным запросам: за сессию и нарастающим итогом
+    за календарный месяц в SQLite, общей для процессов и запусков. В базу
+    их пачкой раз в ``flush_interval`` пишет отдельный поток, как и файлы
+    субтитров в SubtitleWriter. При старте запрашивается /v2/usage — его
+    счёт точнее локального. По мере расхода квоты interim переводятся реже,
+    затем только финалы.
+    """
+
+    LEVELS = ["normal", "fewer interims", "finals only"]
+
+    def __init__(
+        self,
+        path: str | None = DEEPL_USAGE_DB,
+        limit: int = DEEPL_CHAR_LIMIT,
+        flush_interval: float = QUOTA_FLUSH_INTERVAL,
+    ):
+        self.path = path
+        self.limit = limit
+        self.conn: sqlite3.Connection | None = None
+        self.flush_interval = flush_interval
+        self.condition = threading.Condition()
+        self.unsaved = 0  # символы, ещё не записанные в базу
+        self.closed = False
+        self.thread: threading.Thread | None = None
+        self.month = time.strftime("%Y-%m")
+        self.session_chars = 0
+        self.stored_chars = self.load()  # за месяц до этой сессии
+        self.api_chars: int | None = None  # по /v2/usage на момент запроса
+        self.api_base = 0  # session_chars на момент запроса /v2/usage
+        self.level = 0
+        self.update_level()
+
+    def load(self) -> int:
+        if not self.path:
+            return 0
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.conn = sqlite3.connect(
+                self.path, timeout=0.2, isolation_level=None, check_same_thread=False
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS usage ("
+                " month TEXT PRIMARY KEY, characters INTEGER NOT NULL"
+                ")"
+            )
+            row = self.conn.execute(
+                "SELECT characters FROM usage WHERE month = ?", (self.month,)
+            ).fetchone()
+        except (OSError, sqlite3.Error) as e:
+            print(f"[Quota error]: {e}")
+            self.conn = None
+            return 0
+        return row[0] if row else 0
+
+    @property
+    def used(self) -> int:
+        if self.api_chars is not None:
+            return self.api_chars + self.session_chars - self.api_base
+        return self.stored_chars + self.session_chars
+
+    @property
+    def fraction(self) -> float:
+        return self.used / self.limit if self.limit else 0.0
+
+    def record(self, chars: int):
+        """Учесть символы успешного запроса /v2/translate"""
+        self.session_chars += chars
+        if self.conn is not None:
+            with self.condition:
+                self.unsaved += chars
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name="quota-writer", daemon=True
+                )
+                self.thread.start()
+        self.update_level()
 
     def run(self):
+        while True:
+            with self.condition:
+                if not self.closed:
+                    self.condition.wait(self.flush_interval)
+                chars, self.unsaved = self.unsaved, 0
+                closed = self.closed
+            if chars:
+                self.save(chars)
+            if closed:
+                return
+
+    def save(self, chars: int):
         try:
-            asyncio.run(self.process_audio_stream())
-        except KeyboardInterrupt:
-            self.session_active = False
-            print("\nInterrupted")
+            self.conn.execute(
+                "INSERT INTO usage VALUES (?, ?) ON CONFLICT (month)"
+                " DO UPDATE SET characters = characters + excluded.characters",
+                (self.month, chars),
+            )
+        except sqlite3.Error as e:
+            print(f"[Quota error]: {e}")
 
+    def update_level(self):
+        fraction = self.fraction
+        if fraction >= QUOTA_FINALS_ONLY:
+            level = 2
+        elif fraction >= QUOTA_FEWER_INTERIMS:
+            level = 1
+        else:
+            level = 0
+        if level != self.level:
+            print(
+                f"[Quota] {fraction:.0%} of DeepL characters used, "
+                f"translating: {self.LEVELS[level]}"
+            )
+            self.level = level
 
-if __name__ == "__main__":
-    translator = RealTimeSubtitles()
-    translator.run()
+    async def refresh(self, http_client: httpx.AsyncClient, headers: dict[str, str]):
+        """Узнать расход и лимит у DeepL (/v2/usage)"""
+        try:
+            response = await http_client.get(DEEPL_USAGE_URL, headers=headers)
+            response.raise_for_status()
+            usage = response.json()
+            self.api_chars = int(usage["character_count"])
+            self.limit = int(usage.get("character_limit") or self.limit)
+        except Exception as e:
+            print(f"[Quota error]: {e}")
+            return
+        self.api_base = self.session_chars
+        self.update_level()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join(timeout=5.0)
+            self.thread = None
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+class RequestShed(Exception):
+    """Запрос не-финала снят планировщиком DeepL, чтобы не мешать финалам"""
+
+
+def retry_after_seconds(response: httpx.Response) -> float | None:
+    """Значение Retry-After в секундах (число или HTTP-дата)"""
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        moment = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (moment - datetime.now(timezone.utc)).total_seconds())
+
+
+class TokenBucket:
+    """Общий для процесса планировщик запросов к DeepL.
+
+    Токены копятся со скоростью ``rate`` в секунду, всплеск до ``burst``.
+    Ожидающие получают токены строго по приоритету (финалы раньше interim),
+    внутри приоритета — по очереди. На 429 скорость падает вдвое, и запросы
+    приостанавливаются на Retry-After; каждый успешный запрос понемногу
+    возвращает скорость к исходной. Всё, кроме финалов, не пережидает паузу
+    и не ждёт дольше ``interim_max_wait``: его снимают первым (``RequestShed``).
+    """
+
+    def __init__(
+        self,
+        rate: float = DEEPL_MAX_RPS,
+        burst: int = DEEPL_BURST,
+        min_rate: float = DEEPL_MIN_RPS,
+        interim_max_wait: float = DEEPL_INTERIM_MAX_WAIT,
+    ):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate
+        self.burst = burst
+        self.interim_max_wait = interim_max_wait
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0  # пауза по Retry-After
+        self.throttle_streak = 0  # 429 подряд без успешного запроса
+        # Ожидающие токен: (приоритет, номер) — куча, вершина обслуживается
+        self.queue: list[tuple[int, int]] = []
+        self.tickets = itertools.count()
+        self.changed = asyncio.Event()  # очередь или пауза изменились
+        self.waits = 0
+        self.wait_time = 0.0
+        self.throttled = 0
+        self.shed = 0
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def notify(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    async def acquire(self, priority: int = PRIORITY_FINAL):
+        started = time.monotonic()
+        waited = False
+        ticket = (priority, next(self.tickets))
+        heapq.heappush(self.queue, ticket)
+        try:
+            while True:
+                now = time.monotonic()
+                self.refill(now)
+                paused = now < self.paused_until
+                if priority > PRIORITY_FINAL and (
+                    paused or now - started >= self.interim_max_wait
+                ):
+                    self.shed += 1
+                    raise RequestShed()
+                if self.queue[0] != ticket:
+                    delay = None  # ждём, пока обслужат более важные запросы
+                elif paused or self.tokens < 1:
+                    delay = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+                else:
+                    self.tokens -= 1
+                    break
+                if priority > PRIORITY_FINAL:
+                    deadline = started + self.interim_max_wait - now
+                    delay = deadline if delay is None else min(delay, deadline)
+                waited = True
+                try:
+                    await asyncio.wait_for(self.changed.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self.queue.remove(ticket)
+            heapq.heapify(self.queue)
+            self.notify()
+        if waited:
+            self.waits += 1
+            self.wait_time += time.monotonic() - started
+
+    def throttle(self, retry_after: float | None):
+        """DeepL ответил 429: снизить скорость и переждать Retry-After"""
+        now = time.monotonic()
+        self.refill(now)
+        self.throttled += 1
+        self.throttle_streak += 1
+        if now >= self.paused_until:
+            # Одновременные ответы 429 на запросы в полёте — одна перегрузка
+            self.rate = max(self.min_rate, self.rate / 2)
+        if retry_after is None:
+            retry_after = min(
+                DEEPL_RETRY_MAX_DELAY,
+                DEEPL_RETRY_BASE_DELAY * 2 ** (self.throttle_streak - 1),
+            )
+        self.paused_until = max(self.paused_until, now + retry_after)
+        self.tokens = 0.0
+        self.notify()
+
+    def succeeded(self):
+        self.throttle_streak = 0
+        self.rate = min(self.max_rate, self.rate + DEEPL_RATE_RECOVERY)
+
+
+BatchKey = tuple[str, str, int]  # (target_lang, context, приоритет)
+
+
+class DeepLBatcher:
+    """Объединяет близкие по времени тексты в один запрос /v2/translate.
+
+    Тексты копятся ``window`` секунд или до ``max_size`` штук; в один
+    запрос попадают только тексты с одинаковыми параметрами (язык,
+    контекст и приоритет). Каждый вызывающий получает свой перевод через
+    future. Финалы после 429 повторяются, остальные запросы снимаются.
+    """
+
+    def __init__(
+        self,
+        http_client: httpx.AsyncClient,
+        rate_limiter: TokenBucket | None = None,
+        quota: DeepLQuota | None = None,
+        window: float = BATCH_WINDOW,
+        max_size: int = BATCH_MAX_SIZE,
+    ):
+        self.http_client = http_client
+        self.rate_limiter = rate_limiter
+        self.quota = quota
+        self.window = window
+        self.max_size = max_size
+        self.headers = {
+            "Authorization": f"DeepL-Auth-Key {DEEPL_API_KEY}",
+            "User-Agent": "sub_realtime_translator/2.0",
+            "Content-Type": "application/x-www-form-urlencoded",
+        }
+        # (target_lang, context, приоритет) -> текст -> ожидающие его futures
+        self.pending: dict[BatchKey, dict[str, list[asyncio.Future]]] = {}
+        self.timers: dict[BatchKey, asyncio.TimerHandle] = {}
+        self.in_flight: set[asyncio.Task] = set()
+        self.requests = 0
+        self.texts = 0
+
+    async def translate(
+        self,
+        text: str,
+        target_lang: str = TARGET_LANG,
+        context: str = "",
+        priority: int = PRIORITY_FINAL,
+    ) -> str:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = (target_lang, context, priority)
+        batch = self.pending.setdefault(key, {})
+        batch.setdefault(text, []).append(future)
+
+        if len(batch) >= self.max_size:
+            self.flush(key)
+        elif key not in self.timers:
+            self.timers[key] = loop.call_later(self.window, self.flush, key)
+        return await future
+
+    def flush(self, key: BatchKey):
+        timer = self.timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        batch = self.pending.pop(key, None)
+        if batch:
+            task = asyncio.create_task(self.send(key, batch))
+            self.in_flight.add(task)
+            task.add_done_callback(self.in_flight.discard)
+
+    async def send(self, key: BatchKey, batch: dict[str, list[asyncio.Future]]):
+        target_lang, context, priority = key
+        texts = list(batch)
+        data: dict[str, str | list[str]] = {
+            "text": texts,
+            "target_lang": target_lang,
+            "source_lang": TRANSLATION_LANG,
+            "split_sentences": "0",  # Не разбивать на предложения
+            "preserve_formatting": "1",  # Сохранять форматирование
+        }
+        if context:
+            data["context"] = context
+
+        try:
+            for attempt in range(DEEPL_MAX_RETRIES + 1):
+                if self.rate_limiter:
+                    await self.rate_limiter.acquire(priority)
+                self.requests += 1
+                self.texts += len(texts)
+                response = await self.http_client.post(
+                    DEEPL_URL, headers=self.headers, data=data
+                )
+                if response.status_code == 429 and self.rate_limiter:
+                    self.rate_limiter.throttle(retry_after_seconds(response))
+                    if priority > PRIORITY_FINAL:
+                        self.rate_limiter.shed += 1
+                        raise RequestShed()
+                    if attempt < DEEPL_MAX_RETRIES:
+                        continue
+                response.raise_for_status()
+                if self.rate_limiter:
+                    self.rate_limiter.succeeded()
+                if self.quota:
+                    self.quota.record(sum(len(text) for text in texts))
+                break
+            translations = response.json()["translations"]
+            for text, translation in zip(texts, translations, strict=True):
+                for future in batch[text]:
+                    if not future.done():
+                        future.set_result(translation["text"])
+        except Exception as e:
+            for futures in batch.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+
+
+class TranslationServices:
+    """Ресурсы перевода, общие для всех сессий процесса.
+
+    Один пул соединений DeepL, один кэш переводов и один лимит запросов:
+    сессии многопоточного режима (см. ``run_sessions``) делят их между собой.
+    """
+
+    def __init__(self, fuzzy_cache: bool = FUZZY_CACHE_ENABLED):
+        # Персистентный HTTP клиент для DeepL
+        self.http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(3.0, connect=2.0),
+            limits=httpx.Limits(
+                max_keepalive_connections=5,
+                max_connections=10,
+                keepalive_expiry=DEEPL_KEEPALIVE_EXPIRY,
+            ),
+        )
+        self.rate_limiter = TokenBucket()
+        self.quota = DeepLQuota(DEEPL_USAGE_DB)
+        self.batcher = DeepLBatcher(self.http_client, self.rate_limiter, self.quota)
+        self.translation_cache = LRUCache()
+        self.fuzzy_index = FuzzyTranslationIndex() if fuzzy_cache else None
+        self.disk_cache = (
+            PersistentTranslationCache(TRANSLATION_CACHE_DB)
+            if TRANSLATION_CACHE_DB
+            else None
+        )
+
+        self.warmup_task: asyncio.Task | None = None
+        self.warmup_time: float | None = None
+
+    def start(self):
+        """Прогреть DeepL в фоне, не задерживая запуск"""
+        if self.warmup_task is None:
+            self.warmup_task = asyncio.create_task(self.warm_up())
+
+    async def warm_up(self):
+        """DNS, TCP и TLS до DeepL заранее, параллельно с подключением к Deepgram.
+
+        Запрос /v2/usage символов не тратит и заодно обновляет квоту, а
+        соединение остаётся в пуле для первого перевода.
+        """
+        started = time.monotonic()
+        await self.quota.refresh(self.http_client, self.batcher.headers)
+        self.warmup_time = time.monotonic() - started
+
+    async def aclose(self):
+        if self.warmup_task:
+            self.warmup_task.cancel()
+            await asyncio.gather(self.warmup_task, return_exceptions=True)
+        await self.http_client.aclose()
+        if self.disk_cache:
+            self.disk_cache.close()
+        self.quota.close()
+
+    def print_stats(self):
+        cache = self.translation_cache.stats()
+        print(
+            f"[Stats] cache: {cache['entries']} entries, "
+            f"~{cache['bytes'] // 1024} KiB, hit rate {cache['hit_rate']:.1%} "
+            f"({cache['hits']} hits, {cache['misses']} misses, "
+            f"{cache['evictions']} evictions, {cache['expirations']} expired)"
+        )
+        disk = self.disk_cache
+        if disk and (disk.hits or disk.errors):
+            print(
+                f"[Stats] disk cache hits: {disk.hits}"
+                + (f", errors: {disk.errors}" if disk.errors else "")
+            )
+        fuzzy = self.fuzzy_index
+        if fuzzy and fuzzy.lookups:
+            print(
+                f"[Stats] fuzzy cache: {fuzzy.lookups} lookups, "
+                f"{fuzzy.canonical_hits} filler/punctuation matches, "
+                f"{fuzzy.near_hits} near matches, {fuzzy.over_budget} over budget"
+            )
+        if self.batcher.requests:
+            print(
+                f"[Stats] DeepL requests: {self.batcher.requests}, "
+                f"texts: {self.batcher.texts} "
+                f"({self.batcher.texts / self.batcher.requests:.2f} per request)"
+            )
+        if self.warmup_time is not None:
+            print(f"[Stats] DeepL warm-up: {self.warmup_time * 1000:.0f}ms")
+        quota = self.quota
+        if quota.session_chars or quota.api_chars is not None:
+            print(
+                f"[Stats] DeepL characters: {quota.session_chars} this session, "
+                f"{quota.used} of {quota.limit} this month ({quota.fraction:.1%}), "
+                f"translating: {quota.LEVELS[quota.level]}"
+            )
+        limiter = self.rate_limiter
+        if limiter.waits or limiter.throttled:
+            print(
+                f"[Stats] rate limiter: {limiter.waits} requests delayed, "
+                f"{limiter.wait_time:.1f}s total, {limiter.throttled} x 429, "
+                f"{limiter.shed} interims shed, "
+                f"rate {limiter.rate:.1f}/{limiter.max_rate:.1f} per second"
+            )
+
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?…])([\"')\]]*)\s+")
+# Точка после этих слов, одиночной буквы или сокращения с точками внутри
+# (инициалы, U.S., e.g.) — не конец предложения
+SENTENCE_ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "prof", "st", "vs", "etc"}
+
+
+def split_sentences(text: str) -> list[str]:
+    """Разбить транскрипт на предложения по . ! ? и …"""
+    sentences = []
+    start = 0
+    for match in SENTENCE_BOUNDARY.finditer(text):
+        word = text[start : match.start()].rsplit(None, 1)[-1].rstrip(".!?…")
+        if len(word) <= 1 or "." in word or word.lower() in SENTENCE_ABBREVIATIONS:
+            continue
+        sentences.append(text[start : match.end(1)].strip())
+        start = match.end()
+    sentences.append(text[start:].strip())
+    return [sentence for sentence in sentences if sentence]
+
+
+def char_width(char: str) -> int:
+    """Сколько колонок терминала занимает символ"""
+    if unicodedata.combining(char) or unicodedata.category(char) == "Cf":
+        return 0
+    return 2 if unicodedata.east_asian_width(char) in ("W", "F") else 1
+
+
+def display_width(text: str) -> int:
+    return sum(char_width(char) for char in text)
+
+
+class TerminalRenderer:
+    """Вывод субтитров в терминал из отдельного потока.
+
+    Event loop только сохраняет новое состояние: финалы копятся в очереди,
+    от interim остаётся последний. Поток рисует не чаще ``fps`` кадров в
+    секунду и перезаписывает строку interim с первого изменившегося символа,
+    сам перенося её по ширине терминала, поэтому медленный терминал или
+    SSH задерживает только кадры, а не приём результатов. Если вывод не
+    терминал, печатаются только финалы.
+
+    ``on_shown`` у ``commit`` и ``show`` вызывается из потока вывода со
+    временем записи кадра; у interim, заменённого до кадра, не вызывается.
+    """
+
+    def __init__(self, fps: float = RENDER_FPS, stream=None):
+        self.stream = stream or sys.stdout
+        self.interval = 1 / fps if fps > 0 else 0.0
+        self.is_tty = self.stream.isatty()
+        self.condition = threading.Condition()
+        self.thread: threading.Thread | None = None
+        self.closed = False
+        # Состояние, которое ждёт следующего кадра
+        self.pending_clear = False
+        self.pending_finals: list[str] = []
+        self.interim = ""
+        self.pending_shown: list[Callable[[float], None]] = []  # финалов
+        self.interim_shown: Callable[[float], None] | None = None
+        self.dirty = False
+        # Что сейчас на экране (только поток вывода)
+        self.rows: list[str] = []  # строка interim, разбитая по ширине
+        self.cursor = (0, 0)  # (строка, колонка) относительно начала interim
+        self.width = 0
+        self.updates = 0
+        self.frames = 0
+        self.bytes_written = 0
+
+    def clear(self):
+        self.update(clear=True)
+
+    def commit(self, text: str, on_shown: Callable[[float], None] | None = None):
+        """Финальная строка: остаётся на экране над строкой interim"""
+        self.update(final=text, on_shown=on_shown)
+
+    def show(self, text: str, on_shown: Callable[[float], None] | None = None):
+        """Заменить строку interim"""
+        if self.is_tty:
+            self.update(interim=text, on_shown=on_shown)
+
+    def update(
+        self,
+        clear: bool = False,
+        final: str | None = None,
+        interim: str | None = None,
+        on_shown: Callable[[float], None] | None = None,
+    ):
+        with self.condition:
+            if clear:
+                self.pending_clear = self.is_tty
+                self.pending_finals.clear()
+                self.pending_shown.clear()
+            if final is not None:
+                self.pending_finals.append(final)
+                self.interim = ""
+                self.interim_shown = None
+                if on_shown:
+                    self.pending_shown.append(on_shown)
+            if interim is not None:
+                self.interim = interim
+                self.interim_shown = on_shown
+            self.dirty = True
+            self.updates += 1
+            self.condition.notify()
+        if self.thread is None:
+            self.thread = threading.Thread(
+                target=self.run, name="subtitle-renderer", daemon=True
+            )
+            self.thread.start()
+
+    def close(self):
+        """Дорисовать последний кадр и остановить поток"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join(timeout=2.0)
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.dirty and not self.closed:
+                    self.condition.wait()
+                clear, self.pending_clear = self.pending_clear, False
+                finals, self.pending_finals = self.pending_finals, []
+                interim = self.interim
+                shown, self.pending_shown = self.pending_shown, []
+                if self.interim_shown:
+                    shown.append(self.interim_shown)
+                    self.interim_shown = None
+                dirty, self.dirty = self.dirty, False
+                closed = self.closed
+            started = time.monotonic()
+            output = self.render(clear, finals, interim) if dirty else ""
+            if closed and self.rows:
+                output += "\n"  # дальнейший вывод — с новой строки
+                self.rows = []
+            if output:
+                try:
+                    self.stream.write(output)
+                    self.stream.flush()
+                except (OSError, ValueError):
+                    return
+                self.frames += 1
+                self.bytes_written += len(output.encode("utf-8", "replace"))
+            written = time.monotonic()
+            for on_shown in shown:
+                on_shown(written)
+            if closed:
+                return
+            # Обновления, пришедшие за это время, попадут в один кадр
+            time.sleep(max(0.0, started + self.interval - time.monotonic()))
+
+    def render(self, clear: bool, finals: list[str], interim: str) -> str:
+        if not self.is_tty:
+            return "".join(f"{text}\n" for text in finals)
+
+        out = []
+        width = max(2, shutil.get_terminal_size().columns) - 1
+        if width != self.width:
+            # Терминал мог переформатировать старые строки: рисуем заново
+            if self.rows:
+                out.append(self.move_to(0, 0))
+                out.append("\x1b[J")
+            self.rows, self.cursor, self.width = [], (0, 0), width
+        if clear:
+            out.append("\x1b[H\x1b[2J")
+            self.rows, self.cursor = [], (0, 0)
+        if finals:
+            # Финалы встают на место строки interim, она рисуется ниже
+            out.append(self.move_to(0, 0))
+            out.append("\x1b[J")
+            out.extend(f"{text}\n" for text in finals)
+            self.rows, self.cursor = [], (0, 0)
+        out.append(self.diff(self.wrap(interim, width)))
+        return "".join(out)
+
+    def wrap(self, text: str, width: int) -> list[str]:
+        """Разбить строку на строки экрана не шире ``width`` колонок"""
+        text = " ".join(text.split())
+        rows: list[str] = []
+        row: list[str] = []
+        used = 0
+        for char in text:
+            cells = char_width(char)
+            if used + cells > width and row:
+                rows.append("".join(row))
+                row, used = [], 0
+            row.append(char)
+            used += cells
+        if row:
+            rows.append("".join(row))
+        return rows
+
+    def move_to(self, row: int, column: int) -> str:
+        up = self.cursor[0] - row
+        self.cursor = (row, column)
+        return (
+            (f"\x1b[{up}A" if up > 0 else "")
+            + "\r"
+            + (f"\x1b[{column}C" if column else "")
+        )
+
+    def diff(self, rows: list[str]) -> str:
+        """Перерисовать interim с первого отличия от того, что на экране"""
+        old = self.rows
+        index = 0
+        while index < min(len(old), len(rows)) and old[index] == rows[index]:
+            index += 1
+        if index == len(old) == len(rows):
+            return ""
+
+        out = []
+        if index == len(rows):
+            # Новый текст — начало старого: стираем лишние строки
+            last = rows[-1] if rows else ""
+            out.append(self.move_to(max(len(rows) - 1, 0), display_width(last)))
+        else:
+            if index < len(old):
+                # Общий префикс строки не перерисовывается
+                row = rows[index]
+                common = 0
+                limit = min(len(old[index]), len(row))
+                while common < limit and old[index][common] == row[common]:
+                    common += 1
+                while 0 < common < len(row) and char_width(row[common]) == 0:
+                    common -= 1  # не отрываем диакритику от буквы
+                out.append(self.move_to(index, display_width(row[:common])))
+                out.append(row[common:] + "\x1b[K")
+            elif old:
+                out.append(self.move_to(len(old) - 1, display_width(old[-1])))
+                out.append("\n" + rows[index] + "\x1b[K")
+            else:
+                out.append(self.move_to(0, 0))
+                out.append(rows[index] + "\x1b[K")
+            for row in rows[index + 1 :]:
+                out.append("\n" + row + "\x1b[K")
+            self.cursor = (len(rows) - 1, display_width(rows[-1]))
+        out.append("\x1b[J")
+        self.rows = rows
+        return "".join(out)
+
+
+@dataclass
+class SubtitleCue:
+    """Финальный субтитр; время — секунды от начала захвата звука"""
+
+    start: float
+    end: float
+    text: str
+    transcript: str
+    target_lang: str | None = None
+    session: str | None = None
+
+
+class SubtitleSink(abc.ABC):
+    """Файл субтитров, который дописывается по мере появления финалов.
+
+    Каждая запись — законченный блок, поэтому файл остаётся корректным и
+    во время сессии.
+    """
+
+    header = ""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = None
+        self.count = 0
+
+    def write(self, cue: SubtitleCue):
+        if self.file is None:
+            self.file = open(self.path, "w", encoding="utf-8")
+            self.file.write(self.header)
+        self.count += 1
+        self.file.write(self.format(cue))
+
+    @abc.abstractmethod
+    def format(self, cue: SubtitleCue) -> str:
+        """Блок файла для одного субтитра"""
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    @staticmethod
+    def cue_text(text: str) -> str:
+        # Пустая строка и "-->" внутри текста сломали бы разбор блока
+        text = "\n".join(line for line in text.splitlines() if line.strip())
+        return text.replace("-->", "->")
+
+    @staticmethod
+    def timestamp(seconds: float, separator: str) -> str:
+        millis = max(0, round(seconds * 1000))
+        hours, millis = divmod(millis, 3_600_000)
+        minutes, millis = divmod(millis, 60_000)
+        secs, millis = divmod(millis, 1000)
+        return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{millis:03d}"
+
+
+class SrtSink(SubtitleSink):
+    def format(self, cue: SubtitleCue) -> str:
+        return (
+            f"{self.count}\n"
+            f"{self.timestamp(cue.start, ',')} --> {self.timestamp(cue.end, ',')}\n"
+            f"{self.cue_text(cue.text)}\n\n"
+        )
+
+
+class VttSink(SubtitleSink):
+    header = "WEBVTT\n\n"
+
+    def format(self, cue: SubtitleCue) -> str:
+        return (
+            f"{self.timestamp(cue.start, '.')} --> {self.timestamp(cue.end, '.')}\n"
+            f"{self.cue_text(cue.text)}\n\n"
+        )
+
+
+class JsonlSink(SubtitleSink):
+    def format(self, cue: SubtitleCue) -> str:
+        record = {"index": self.count, **asdict(cue)}
+        record["start"] = round(cue.start, 3)
+        record["end"] = round(cue.end, 3)
+        return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+SINK_FORMATS: dict[str, type[SubtitleSink]] = {
+    ".srt": SrtSink,
+    ".vtt": VttSink,
+    ".jsonl": JsonlSink,
+}
+
+
+class SubtitleWriter:
+    """Запись субтитров в файлы из отдельного потока.
+
+    Event loop только кладёт субтитр в список; поток раз в
+    ``flush_interval`` секунд записывает накопившееся пачкой и сбрасывает
+    файлы на диск, так что медленный диск не задерживает вывод.
+    """
+
+    def __init__(self, paths: list[str], flush_interval: float = SINK_FLUSH_INTERVAL):
+        self.sinks = [
+            SINK_FORMATS[os.path.splitext(path)[1].lower()](path) for path in paths
+        ]
+        self.flush_interval = flush_interval
+        self.condition = threading.Condition()
+        self.pending: list[SubtitleCue] = []
+        self.closed = False
+        self.thread: threading.Thread | None = None
+
+    def write(self, cue: SubtitleCue):
+        with self.condition:
+            self.pending.append(cue)
+        if self.thread is None:
+            self.thread = threading.Thread(
+                target=self.run, name="subtitle-writer", daemon=True
+            )
+            self.thread.start()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join(timeout=5.0)
+
+    def run(self):
+        while True:
+            with self.condition:
+                if not self.closed:
+                    self.condition.wait(self.flush_interval)
+                cues, self.pending = self.pending, []
+                closed = self.closed
+            for sink in list(self.sinks):
+                try:
+                    for cue in cues:
+                        sink.write(cue)
+                    sink.flush()
+                    if closed:
+                        sink.close()
+                except OSError as e:
+                    print(f"[Subtitle output error]: {sink.path}: {e}")
+                    self.sinks.remove(sink)
+            if closed:
+                return
+
+
+class BroadcastSubscriber:
+    """Очередь сообщений одного зрителя.
+
+    Неотправленный interim заменяется более новым; если очередь полна,
+    interim отбрасывается, а финал, которому не хватило места, означает,
+    что клиент не успевает, и его отключают.
+    """
+
+    def __init__(self, limit: int, replay: list[str]):
+        self.limit = limit
+        self.replay = replay  # финалы, показанные до подключения
+        self.messages: deque[tuple[bool, str]] = deque()  # (финал, JSON)
+        self.ready = asyncio.Event()
+        self.sender: asyncio.Task | None = None
+        self.dropped = 0
+
+    def push(self, payload: str, is_final: bool) -> bool:
+        """False — клиент не успевает за финалами"""
+        if not is_final or len(self.messages) >= self.limit:
+            pending = len(self.messages)
+            self.messages = deque(m for m in self.messages if m[0])
+            self.dropped += pending - len(self.messages)
+        if len(self.messages) >= self.limit:
+            if is_final:
+                return False
+            self.dropped += 1
+            return True
+        self.messages.append((is_final, payload))
+        self.ready.set()
+        return True
+
+
+class SubtitleBroadcaster:
+    """Раздача субтитров по websocket (``/ws``) и SSE (``/events``).
+
+    Сообщение сериализуется один раз и раскладывается по очередям
+    клиентов; отправкой каждого клиента занимается своя задача, поэтому
+    медленный зритель задерживает только себя. Новые клиенты сначала
+    получают последние ``BROADCAST_HISTORY`` финалов. На ``/`` — простая
+    страница для OBS и браузера.
+    """
+
+    PAGE = """<!doctype html>
+<meta charset="utf-8">
+<style>
+body { margin: 0; font: 32px sans-serif; color: #fff; background: transparent; }
+#subs { position: fixed; bottom: 5%; width: 100%; text-align: center; }
+#subs div { display: inline-block; padding: 4px 12px; background: rgba(0,0,0,.6); }
+.interim { opacity: .7; }
+</style>
+<div id="subs"><div id="final"></div><br><div id="interim" class="interim"></div></div>
+<script>
+const source = new EventSource("events");
+source.onmessage = (event) => {
+  const message = JSON.parse(event.data);
+  if (message.type === "final") {
+    document.getElementById("final").textContent = message.text;
+    document.getElementById("interim").textContent = "";
+  } else {
+    document.getElementById("interim").textContent = message.text;
+  }
+};
+</script>
+"""
+
+    def __init__(
+        self,
+        address: str,
+        queue_size: int = BROADCAST_QUEUE_SIZE,
+        history: int = BROADCAST_HISTORY,
+    ):
+        host, _, port = address.rpartition(":")
+        self.host = host or "127.0.0.1"
+        self.port = int(port)
+        self.queue_size = queue_size
+        self.history: deque[str] = deque(maxlen=history)
+        self.subscribers: set[BroadcastSubscriber] = set()
+        self.runner: web.AppRunner | None = None
+        self.peak_clients = 0
+        self.total_clients = 0
+        self.messages = 0
+        self.interims_dropped = 0
+        self.slow_disconnects = 0
+
+    async def start(self):
+        from aiohttp import web
+
+        if self.runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get("/", self.handle_page)
+        app.router.add_get("/ws", self.handle_websocket)
+        app.router.add_get("/events", self.handle_events)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        print(f"Subtitles served at http://{self.host}:{self.port}/")
+
+    async def stop(self):
+        if self.runner is not None:
+            # Открытые потоки SSE иначе держали бы остановку сервера
+            for subscriber in list(self.subscribers):
+                self.unsubscribe(subscriber)
+                if subscriber.sender:
+                    subscriber.sender.cancel()
+            await self.runner.cleanup()
+            self.runner = None
+
+    def publish_final(self, cue: SubtitleCue):
+        record = {"type": "final", **asdict(cue)}
+        record["start"] = round(cue.start, 3)
+        record["end"] = round(cue.end, 3)
+        payload = json.dumps(record, ensure_ascii=False)
+        self.history.append(payload)
+        self.publish(payload, is_final=True)
+
+    def publish_interim(self, text: str, target_lang: str, session: str | None):
+        record = {
+            "type": "interim",
+            "text": text,
+            "target_lang": target_lang,
+            "session": session,
+        }
+        self.publish(json.dumps(record, ensure_ascii=False), is_final=False)
+
+    def publish(self, payload: str, is_final: bool):
+        self.messages += 1
+        for subscriber in list(self.subscribers):
+            if not subscriber.push(payload, is_final):
+                self.slow_disconnects += 1
+                self.unsubscribe(subscriber)
+                if subscriber.sender:
+                    subscriber.sender.cancel()
+
+    def subscribe(self) -> BroadcastSubscriber:
+        subscriber = BroadcastSubscriber(self.queue_size, list(self.history))
+        self.subscribers.add(subscriber)
+        self.total_clients += 1
+        self.peak_clients = max(self.peak_clients, len(self.subscribers))
+        return subscriber
+
+    def unsubscribe(self, subscriber: BroadcastSubscriber):
+        if subscriber in self.subscribers:
+            self.subscribers.discard(subscriber)
+            self.interims_dropped += subscriber.dropped
+
+    async def stream(self, subscriber: BroadcastSubscriber, send):
+        """Отправлять клиенту сообщения; ``send(None)`` — ping"""
+        for payload in subscriber.replay:
+            await send(payload)
+        subscriber.replay = []
+        while True:
+            if not subscriber.messages:
+                subscriber.ready.clear()
+                try:
+                    await asyncio.wait_for(subscriber.ready.wait(), BROADCAST_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    await send(None)
+                continue
+            _, payload = subscriber.messages.popleft()
+            await send(payload)
+
+    async def handle_page(self, request: web.Request) -> web.Response:
+        from aiohttp import web
+
+        return web.Response(text=self.PAGE, content_type="text/html")
+
+    async def handle_websocket(self, request: web.Request) -> web.WebSocketResponse:
+        from aiohttp import WSMsgType, web
+
+        ws = web.WebSocketResponse(heartbeat=BROADCAST_HEARTBEAT)
+        await ws.prepare(request)
+
+        async def send(payload: str | None):
+            if payload is not None:  # ping шлёт сам aiohttp
+                await ws.send_str(payload)
+
+        async def receive():
+            # Входящие сообщения не нужны, но без чтения не обработать pong и close
+            async for message in ws:
+                if message.type == WSMsgType.ERROR:
+                    break
+
+        subscriber = self.subscribe()
+        subscriber.sender = asyncio.create_task(self.stream(subscriber, send))
+        receiver = asyncio.create_task(receive())
+        try:
+            await asyncio.wait(
+                {subscriber.sender, receiver}, return_when=asyncio.FIRST_COMPLETED
+            )
+        finally:
+            self.unsubscribe(subscriber)
+            for task in (subscriber.sender, receiver):
+                task.cancel()
+            await asyncio.gather(subscriber.sender, receiver, return_exceptions=True)
+            await ws.close()
+        return ws
+
+    async def handle_events(self, request: web.Request) -> web.StreamResponse:
+        from aiohttp import web
+
+        response = web.StreamResponse(
+            headers={
+                "Content-Type": "text/event-stream",
+                "Cache-Control": "no-cache",
+                "Access-Control-Allow-Origin": "*",
+            }
+        )
+        await response.prepare(request)
+
+        async def send(payload: str | None):
+            line = ": ping\n\n" if payload is None else f"data: {payload}\n\n"
+            await response.write(line.encode("utf-8"))
+
+        subscriber = self.subscribe()
+        subscriber.sender = asyncio.create_task(self.stream(subscriber, send))
+        try:
+            await subscriber.sender
+        except (asyncio.CancelledError, ConnectionError):
+            pass
+        finally:
+            self.unsubscribe(subscriber)
+            subscriber.sender.cancel()
+        return response
+
+    def print_stats(self):
+        print(
+            f"[Stats] broadcast: {self.total_clients} clients "
+            f"(peak {self.peak_clients} at once), {self.messages} messages, "
+            f"{self.interims_dropped} interims dropped for slow clients, "
+            f"{self.slow_disconnects} clients disconnected as too slow"
+        )
+
+
+class TranslationLane:
+    """Перевод потока транскриптов на один целевой язык.
+
+    У каждого языка свои очереди, воркеры и контекст (предыдущие финалы на
+    этом языке), поэтому медленный язык не задерживает остальные, а
+    Deepgram распознаёт звук один раз для всех языков.
+    """
+
+    def __init__(
+        self,
+        session: "RealTimeSubtitles",
+        target_lang: str,
+        label: str = "",
+        writer: SubtitleWriter | None = None,
+    ):
+        self.session = session
+        self.target_lang = target_lang
+        self.label = label  # префикс строк на экране при нескольких языках
+        self.writer = writer  # файлы субтитров этого языка
+        self.final_buffer: deque[str] = deque(maxlen=CONTEXT_WINDOW)
+        # Финальные фразы идут через очередь строго по порядку,
+        # для interim хранится только самая свежая гипотеза (latest-wins)
+        self.final_queue: asyncio.Queue[TranscriptSegment] = asyncio.Queue()
+        self.pending_interim: TranscriptSegment | None = None
+        self.interim_event = asyncio.Event()
+        self.shown_interim_seq = 0  # interim, который сейчас на экране
+        self.speculation: Speculation | None = None
+        self.finals_busy = False  # пачка финалов переводится прямо сейчас
+
+    def submit_final(self, segment: TranscriptSegment):
+        # Ожидающий interim относится к уже завершённой фразе
+        if self.pending_interim and self.pending_interim.seq < segment.seq:
+            self.pending_interim = None
+        self.final_queue.put_nowait(replace(segment, target_lang=self.target_lang))
+
+    def submit_interim(self, segment: TranscriptSegment):
+        self.pending_interim = replace(segment, target_lang=self.target_lang)
+        self.interim_event.set()
+
+    def get_context(self) -> str:
+        """Получить контекст из предыдущих финальных фраз"""
+        if len(self.final_buffer) == 0:
+            return ""
+        return " ".join(list(self.final_buffer))
+
+    def speculate(self, segment: TranscriptSegment):
+        """Начать перевод interim с тем контекстом, который получит финал"""
+        session = self.session
+        if self.finals_busy or not self.final_queue.empty():
+            return  # контекст финала ещё не известен
+        normalized = session.normalize_text(segment.transcript)
+        context = self.get_context()
+        current = self.speculation
+        if current and (current.normalized, current.context) == (normalized, context):
+            return
+        if session.is_cached(segment.transcript, self.target_lang):
+            return  # финал и так возьмётся из кэша
+        if current:
+            session.speculation_wasted(current)
+        task = asyncio.create_task(
+            session.translate_text(
+                segment.transcript,
+                self.target_lang,
+                context,
+                utterance=segment.utterance,
+                priority=PRIORITY_SPECULATIVE,
+            )
+        )
+        task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        self.speculation = Speculation(
+            normalized,
+            context,
+            segment.utterance,
+            len(segment.transcript),
+            time.monotonic(),
+            task,
+        )
+        session.speculations += 1
+
+    async def translate_final(self, segment: TranscriptSegment, context: str) -> str:
+        """Перевод финала; совпавший спекулятивный перевод используется повторно"""
+        session = self.session
+        speculation = self.speculation
+        if speculation and speculation.utterance == segment.utterance:
+            self.speculation = None
+            normalized = session.normalize_text(segment.transcript)
+            if (speculation.normalized, speculation.context) == (normalized, context):
+                session.speculation_hits += 1
+                session.speculation_head_start += (
+                    segment.received_at - speculation.started_at
+                )
+                try:
+                    return await speculation.task
+                except RequestShed:
+                    pass  # DeepL был перегружен: переводим как обычный финал
+            else:
+                session.speculation_wasted(speculation)
+        return await session.translate_text(
+            segment.transcript,
+            self.target_lang,
+            context,
+            utterance=segment.utterance,
+        )
+
+    async def final_worker(self):
+        """Переводит финальные фразы, сохраняя порядок.
+
+        Накопившиеся в очереди финалы (всплеск речи, догоняющий поток)
+        забираются разом и переводятся одним запросом через batcher. Все они
+        получают общий контекст — фразы, выведенные до этой пачки.
+        """
+        session = self.session
+        while True:
+            segments = [await self.final_queue.get()]
+            while not self.final_queue.empty():
+                segments.append(self.final_queue.get_nowait())
+            self.finals_busy = True
+            try:
+                translate_started = time.monotonic()
+                context = self.get_context()
+                translations = await asyncio.gather(
+                    *(self.translate_final(segment, context) for segment in segments)
+                )
+                translated_at = time.monotonic()
+                for segment, translated in zip(segments, translations):
+                    segment.translate_started_at = translate_started
+                    segment.translated_at = translated_at
+                    session.calls_per_utterance.append(
+                        session.utterance_api_calls.pop(
+                            (self.target_lang, segment.utterance), 0
+                        )
+                    )
+                    on_shown = session.record_when_shown(segment, translated)
+                    if session.print_final(translated, self, segment.seq, on_shown):
+                        self.publish_final(segment, translated)
+            finally:
+                self.finals_busy = False
+                for _ in segments:
+                    self.final_queue.task_done()
+
+    def publish_final(self, segment: TranscriptSegment, translated: str):
+        """Отдать показанный финал в файлы субтитров и зрителям"""
+        broadcaster = self.session.broadcaster
+        if self.writer is None and broadcaster is None:
+            return
+        cue = SubtitleCue(
+            start=self.session.capture_seconds(segment.start),
+            end=self.session.capture_seconds(segment.end),
+            text=translated,
+            transcript=segment.transcript,
+            target_lang=self.target_lang,
+            session=self.session.name,
+        )
+        if self.writer:
+            self.writer.write(cue)
+        if broadcaster:
+            broadcaster.publish_final(cue)
+
+    async def interim_worker(self):
+        """Переводит только самую свежую interim-гипотезу.
+
+        Запрос в полёте не отменяется (отмена рвёт keep-alive соединение,
+        а при p95 DeepL выше интервала interim ни один перевод не дошёл бы
+        до экрана), но его результат отбрасывается, если на экране уже
+        есть более новая гипотеза или фраза успела стать финальной.
+        """
+        session = self.session
+        while True:
+            await self.interim_event.wait()
+            self.interim_event.clear()
+            if self.pending_interim is None:
+                continue
+            segment = self.pending_interim
+            self.pending_interim = None
+
+            segment.translate_started_at = time.monotonic()
+            try:
+                translated = await session.translate_text(
+                    segment.transcript,
+                    self.target_lang,
+                    utterance=segment.utterance,
+                    priority=PRIORITY_INTERIM,
+                )
+            except RequestShed:
+                continue  # DeepL перегружен: место отдано финалам
+            segment.translated_at = time.monotonic()
+            if (
+                segment.seq > session.last_final_seq
+                and segment.seq > self.shown_interim_seq
+            ):
+                self.shown_interim_seq = segment.seq
+                # На экране одна строка interim — первого языка; остальные
+                # языки и сессии переводят interim только для зрителей
+                on_screen = self is session.lanes[0] and session.name is None
+                if on_screen:
+                    session.print_interim(
+                        self.label + translated,
+                        session.record_when_shown(segment, translated),
+                    )
+                if session.broadcaster:
+                    session.broadcaster.publish_interim(
+                        translated, self.target_lang, session.name
+                    )
+                if not on_screen:
+                    segment.shown_at = time.monotonic()
+                    session.latency.record(segment, translated)
+
+
+class DeepgramStream(abc.ABC):
+    """Звуковая сторона сессии: захват, VAD, очередь на отправку и соединение
+    с Deepgram с переподключением.
+
+    Результаты распознавания уходят в ``submit_final`` и ``on_interim``,
+    которые определяют наследники: RealTimeSubtitles переводит их, а
+    AudioProcessStream передаёт в основной процесс (``--capture-process``).
+    """
+
+    def __init__(
+        self,
+        source: str = "pulse",
+        speed: float | None = 1.0,
+        codec: str = UPSTREAM_CODEC,
+        overflow: str = OVERFLOW_POLICY,
+        capture: bool = True,
+    ):
+        self.source = source
+        # Системный звук идёт в своём темпе; остальные источники — в заданном
+        self.live_source = source == "pulse"
+        if codec != "linear16" and shutil.which("ffmpeg") is None:
+            print(f"ffmpeg not found, sending linear16 instead of {codec}")
+            codec = "linear16"
+        self.codec = codec
+        self.upstream_bytes = 0  # отправлено в Deepgram после сжатия
+        self.speed = speed
+        self.session_active = False
+        self.websocket = None
+        # capture=False — звук захватывает процесс захвата, здесь нужны
+        # только его результаты и статистика
+        self.vad = VoiceActivityGate() if VAD_ENABLED and capture else None
+        if overflow == "skip-silence" and capture and not self.vad:
+            print("skip-silence needs the VAD, dropping oldest audio instead")
+            overflow = "drop-oldest"
+        self.overflow = overflow
+
+        # Захват звука не зависит от соединения: пока Deepgram недоступен,
+        # звук копится в кольцевом буфере и после переподключения
+        # повторяется с последнего подтверждённого финалом места
+        ring_seconds = RING_BUFFER_SECONDS if capture else 0
+        self.ring = PcmRingBuffer(int(ring_seconds * BYTES_PER_SECOND))
+        self.audio_available = asyncio.Event()
+        self.audio_sent = asyncio.Event()
+        self.capture_done = False
+        self.captured_bytes = 0
+        self.send_cursor = 0  # сколько байт потока уже ушло в Deepgram
+        # Очередь на отправку — звук в буфере после позиции текущего
+        # соединения; для живого звука она ограничена SEND_QUEUE_SECONDS
+        self.queue_cursor = 0
+        self.queue_limit = round(SEND_QUEUE_SECONDS / CHUNK_DURATION) * CHUNK_SIZE
+        self.queue_timeline = Timeline()  # позиция потока -> момент записи
+        self.send_lag = LatencyHistogram()  # запись в буфер -> отправка
+        self.max_queue_depth = 0.0
+        self.dropped_bytes = 0  # отброшено политикой drop-oldest
+        self.skipped_bytes = 0  # тишина, не поставленная в очередь
+        self.started_at = 0.0
+        self.connection_base = 0  # позиция в потоке, с которой начато соединение
+        # Точки (байт отправлено в соединение, позиция в потоке) — если
+        # отправка отстала больше, чем вмещает буфер, в потоке будет разрыв
+        self.connection_timeline: list[tuple[int, int]] = [(0, 0)]
+        self.acked_offset = 0  # конец последнего финала (байты потока)
+        self.last_final_end = 0.0  # конец последнего финала (секунды потока)
+        self.unanswered_since: float | None = None  # звук без ответа с этого момента
+        self.connect_time: float | None = None  # от старта до соединения с Deepgram
+        self.reconnects = 0
+        self.reconnect_time = 0.0
+        self.replayed_bytes = 0
+        self.duplicates_dropped = 0
+        self.capture_timeline = Timeline()  # захвачено байт -> момент
+        self.send_timeline = Timeline()  # позиция потока -> момент отправки
+        self.message_seq = 0  # порядковый номер сообщения Deepgram
+
+    @abc.abstractmethod
+    def submit_final(self, segment: TranscriptSegment):
+        """Финал Deepgram"""
+
+    @abc.abstractmethod
+    def on_interim(self, segment: TranscriptSegment):
+        """Промежуточная гипотеза Deepgram"""
+
+    async def run_audio(self):
+        """Захват и соединение с Deepgram; возвращается, когда звук распознан"""
+        capture_task = asyncio.create_task(self.capture_audio(self.open_audio()))
+        try:
+            await self.run_connections()
+        finally:
+            capture_task.cancel()
+            await asyncio.gather(capture_task, return_exceptions=True)
+
+    def open_audio(self):
+        """Звук сессии; файлы и каналы идут в темпе ``speed``"""
+        audio = open_audio_source(self.source)
+        if not self.live_source:
+            audio = pace_audio(audio, self.speed)
+        return audio
+
+    async def run_connections(self):
+        """Держит соединение с Deepgram, переподключаясь с backoff"""
+        attempt = 0
+        disconnected_at: float | None = None
+        while self.session_active:
+            try:
+                async with websocket_connect(
+                    self.listen_url(),
+                    extra_headers={"Authorization": f"Token {DEEPGRAM_API_KEY}"},
+                    ping_interval=10,
+                    ping_timeout=30,
+                ) as ws:
+                    self.websocket = ws
+                    self.unanswered_since = None
+                    attempt = 0
+                    if self.connect_time is None:
+                        self.connect_time = time.monotonic() - self.started_at
+                    # Повторяем всё, что не подтверждено финалом
+                    self.connection_base = max(self.acked_offset, self.ring.start)
+                    self.queue_cursor = self.connection_base
+                    self.connection_timeline = [(0, self.connection_base)]
+                    self.send_timeline.truncate_after(self.connection_base)
+                    if disconnected_at is not None:
+                        self.reconnects += 1
+                        self.reconnect_time += time.monotonic() - disconnected_at
+                        disconnected_at = None
+
+                    if await self.stream_connection(ws):
+                        return
+            except InvalidStatusCode as e:
+                # Неверный ключ или параметры — повтор не поможет
+                if 400 <= e.status_code < 500 and e.status_code != 429:
+                    print(f"Connection error: {e}")
+                    return
+                print(f"Connection error: {e}")
+            except Exception as e:
+                print(f"Connection error: {e}")
+            finally:
+                self.websocket = None
+
+            if not self.session_active:
+                return
+            if disconnected_at is None:
+                disconnected_at = time.monotonic()
+            delay = min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * 2**attempt)
+            attempt += 1
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+
+    def listen_url(self) -> str:
+        # Правильные параметры Deepgram API; формат Ogg/Opus и FLAC Deepgram
+        # определяет по заголовку, encoding указывается только для сырого PCM
+        params = (
+            f"model=nova-2&language={TRANSLATION_LANG}"
+            "&punctuate=true&interim_results=true"
+            "&endpointing=300&smart_format=true"
+        )
+        if self.codec == "linear16":
+            params = "encoding=linear16&sample_rate=16000&channels=1&" + params
+        return f"{DEEPGRAM_URL}?{params}"
+
+    async def stream_connection(self, ws) -> bool:
+        """Одно соединение; True — звук закончился и результаты получены"""
+        receive_task = asyncio.create_task(self.receive_results(ws))
+        send_task = asyncio.create_task(self.send_audio(ws, self.connection_base))
+        try:
+            await asyncio.wait(
+                {receive_task, send_task}, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not (send_task.done() and send_task.result()):
+                return False
+
+            # Весь звук отправлен: просим Deepgram закрыть поток и ждём
+            # последних результатов до закрытия сокета
+            try:
+                await ws.send(json.dumps({"type": "CloseStream"}))
+                await asyncio.wait_for(asyncio.shield(receive_task), DRAIN_TIMEOUT)
+            except Exception:
+                pass
+            return True
+        finally:
+            for task in (send_task, receive_task):
+                task.cancel()
+            await asyncio.gather(send_task, receive_task, return_exceptions=True)
+
+    async def capture_audio(self, audio):
+        """Читает звук, пропускает через VAD и пишет в кольцевой буфер.
+
+        Кольцевой буфер — очередь к задаче отправки: чтение источника не ждёт
+        сети, а отставание отправки ограничивается политикой ``overflow``.
+        """
+        try:
+            async for chunk in audio:
+                self.captured_bytes += len(chunk)
+                now = time.monotonic()
+                self.capture_timeline.add(self.captured_bytes, now)
+                overfull = self.live_source and self.queue_bytes > self.queue_limit
+                strict = overfull and self.overflow == "skip-silence"
+                chunks = self.vad.process(chunk, strict) if self.vad else [chunk]
+                if strict and not chunks:
+                    self.skipped_bytes += len(chunk)
+                for out in chunks:
+                    # Файл может подождать отправки, живой звук — нет
+                    while (
+                        not self.live_source
+                        and self.ring.end + len(out) - self.ring.capacity
+                        > self.send_cursor
+                    ):
+                        self.audio_sent.clear()
+                        await self.audio_sent.wait()
+                    self.ring.write(out)
+                    self.queue_timeline.add(self.ring.end, now)
+                if chunks:
+                    self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+                    self.audio_available.set()
+        finally:
+            self.capture_done = True
+            self.audio_available.set()
+
+    async def send_audio(self, ws, cursor: int) -> bool:
+        """Отправляет звук из буфера; True — звук закончился.
+
+        Позиции и время отправки считаются в байтах PCM: кодер сохраняет
+        длительность, и Deepgram отсчитывает время так же, как для PCM.
+        """
+        last_send = time.monotonic()
+        sent = 0
+        encoder = None
+        try:
+            if self.codec != "linear16":
+                encoder = AudioEncoder(self.codec, ws.send)
+                await encoder.start()
+            while True:
+                if cursor < self.ring.start:
+                    # Отправка отстала больше, чем вмещает буфер: часть звука потеряна
+                    cursor = self.ring.start
+                    self.connection_timeline.append((sent, cursor))
+                if (
+                    self.live_source
+                    and self.overflow == "drop-oldest"
+                    and cursor >= self.send_cursor
+                    and self.ring.end - cursor > self.queue_limit
+                ):
+                    # Субтитры должны идти вживую: старый звук пропускается.
+                    # Повтор неподтверждённого звука после переподключения
+                    # не отбрасывается — пропуск начинается после него
+                    self.dropped_bytes += self.ring.end - self.queue_limit - cursor
+                    cursor = self.ring.end - self.queue_limit
+                    self.connection_timeline.append((sent, cursor))
+                if cursor < self.ring.end:
+                    chunk = self.ring.read(cursor, CHUNK_SIZE)
+                    try:
+                        if encoder:
+                            await encoder.write(chunk)
+                        else:
+                            await ws.send(chunk)
+                            self.upstream_bytes += len(chunk)
+                    except Exception as e:
+                        print(f"Send error: {e}")
+                        return False
+                    if cursor < self.send_cursor:
+                        self.replayed_bytes += min(
+                            len(chunk), self.send_cursor - cursor
+                        )
+                    cursor += len(chunk)
+                    sent += len(chunk)
+                    self.queue_cursor = cursor
+                    self.send_cursor = max(self.send_cursor, cursor)
+                    self.audio_sent.set()
+                    last_send = time.monotonic()
+                    queued_at = self.queue_timeline.time_at(cursor)
+                    if queued_at is not None:
+                        self.send_lag.add(last_send - queued_at)
+                    self.send_timeline.add(cursor, last_send)
+                    if self.unanswered_since is None:
+                        self.unanswered_since = last_send
+                    continue
+                if self.capture_done:
+                    if encoder:
+                        try:
+                            await encoder.finish()  # хвост, оставшийся в кодере
+                        except Exception as e:
+                            print(f"Send error: {e}")
+                            return False
+                    return True
+
+                self.audio_available.clear()
+                try:
+                    await asyncio.wait_for(
+                        self.audio_available.wait(),
+                        max(0.0, last_send + KEEPALIVE_INTERVAL - time.monotonic()),
+                    )
+                except asyncio.TimeoutError:
+                    # Без аудио соединение живёт только на KeepAlive
+                    try:
+                        await ws.send(json.dumps({"type": "KeepAlive"}))
+                    except Exception as e:
+                        print(f"Send error: {e}")
+                        return False
+                    last_send = time.monotonic()
+        finally:
+            if encoder:
+                await encoder.close()
+                self.upstream_bytes += encoder.encoded_bytes
+
+    @property
+    def queue_bytes(self) -> int:
+        """Звук в буфере, ещё не отправленный в текущее соединение"""
+        return self.ring.end - max(self.queue_cursor, self.ring.start)
+
+    @property
+    def queue_depth(self) -> float:
+        """Глубина очереди на отправку, секунды звука"""
+        return self.queue_bytes / BYTES_PER_SECOND
+
+    def stream_time(self, offset_seconds: float) -> float:
+        """Время в потоке сессии для времени внутри текущего соединения"""
+        sent = offset_seconds * BYTES_PER_SECOND
+        index = bisect.bisect_right(self.connection_timeline, (sent, math.inf)) - 1
+        sent_at, stream_at = self.connection_timeline[max(index, 0)]
+        return (stream_at + sent - sent_at) / BYTES_PER_SECOND
+
+    def capture_seconds(self, stream_seconds: float) -> float:
+        """Позиция в захваченном звуке (секунды) для времени потока сессии"""
+        if self.vad:
+            return self.vad.to_capture_time(stream_seconds)
+        return stream_seconds
+
+    def capture_time_of(self, stream_seconds: float) -> float | None:
+        """Момент захвата звука, на котором закончился результат Deepgram"""
+        captured = self.capture_seconds(stream_seconds)
+        return self.capture_timeline.time_at(stream_offset(captured))
+
+    async def receive_results(self, ws):
+        while self.session_active:
+            try:
+                result = await asyncio.wait_for(ws.recv(), timeout=RECEIVE_TIMEOUT)
+                self.unanswered_since = None
+                data = json.loads(result)
+
+                if "channel" in data:
+                    start = self.stream_time(data.get("start", 0.0))
+                    end = start + data.get("duration", 0.0)
+                    is_final = data.get("is_final", False)
+
+                    # После переподключения повторно распознанный звук
+                    # может дать уже показанный финал
+                    if end <= self.last_final_end + DUPLICATE_TOLERANCE:
+                        if is_final:
+                            self.duplicates_dropped += 1
+                        continue
+                    if is_final:
+                        self.last_final_end = end
+                        self.acked_offset = stream_offset(end)
+
+                    transcript = data["channel"]["alternatives"][0]["transcript"]
+                    if not transcript.strip():
+                        continue
+
+                    # Перевод идёт в отдельных воркерах, чтобы медленный
+                    # DeepL не мешал читать websocket
+                    self.message_seq += 1
+                    segment = TranscriptSegment(
+                        seq=self.message_seq,
+                        transcript=transcript,
+                        is_final=is_final,
+                        start=start,
+                        end=end,
+                        received_at=time.monotonic(),
+                        captured_at=self.capture_time_of(end),
+                        sent_at=self.send_timeline.time_at(stream_offset(end)),
+                    )
+                    if is_final:
+                        self.submit_final(segment)
+                    else:
+                        self.on_interim(segment)
+
+            except asyncio.TimeoutError:
+                # Тишина (VAD не отправляет звук) — ответов и не ждём
+                since = self.unanswered_since
+                if since is not None and time.monotonic() - since >= RECEIVE_TIMEOUT:
+                    print("Timeout waiting for Deepgram response")
+                    break
+            except (asyncio.CancelledError, ConnectionClosedOK):
+                break
+            except Exception as e:
+                print(f"Receive error: {e}")
+                break
+
+
+class AudioProcessStream(DeepgramStream):
+    """Звуковая сторона сессии в процессе захвата (``--capture-process``).
+
+    Результаты Deepgram уходят в основной процесс по ``channel`` уже со
+    временем захвата: VAD живёт здесь. Если основной процесс умер (канал
+    закрыт или ``parent`` не жив), захват останавливается — иначе сирота
+    продолжал бы отправлять платный звук в Deepgram.
+    """
+
+    # Статистика, которую основной процесс получает по завершении
+    STATS = (
+        "codec",
+        "connect_time",
+        "captured_bytes",
+        "upstream_bytes",
+        "send_cursor",
+        "send_lag",
+        "max_queue_depth",
+        "dropped_bytes",
+        "skipped_bytes",
+        "vad",
+        "reconnects",
+        "reconnect_time",
+        "replayed_bytes",
+        "duplicates_dropped",
+    )
+
+    def __init__(self, options: dict, channel):
+        super().__init__(
+            options["source"],
+            options["speed"],
+            options["codec"],
+            options["overflow"],
+        )
+        self.url = options["listen_url"]
+        self.started_at = options["started_at"]
+        self.channel = channel
+        self.parent = multiprocessing.parent_process()
+
+    def listen_url(self) -> str:
+        return self.url
+
+    def submit_final(self, segment: TranscriptSegment):
+        self.forward(segment)
+
+    def on_interim(self, segment: TranscriptSegment):
+        self.forward(segment)
+
+    def forward(self, segment: TranscriptSegment):
+        segment.start = self.capture_seconds(segment.start)
+        segment.end = self.capture_seconds(segment.end)
+        self.send(("segment", segment))
+
+    def send(self, message: tuple[str, object]):
+        """Сообщение основному процессу; его нет — сессия закончена"""
+        try:
+            self.channel.send(message)
+        except OSError:  # BrokenPipeError и закрытый канал
+            self.session_active = False
+
+    async def watch_parent(self):
+        """Вернуться, когда основной процесс умер.
+
+        Без речи VAD ничего не отправляет, и Deepgram ничего не отвечает —
+        закрытый канал тогда не заметить, поэтому процесс проверяется сам.
+        """
+        while self.parent is None or self.parent.is_alive():
+            await asyncio.sleep(PARENT_CHECK_INTERVAL)
+        self.session_active = False
+
+    async def run(self):
+        self.session_active = True
+        numpy_task = asyncio.create_task(asyncio.to_thread(load_numpy))
+        audio_task = asyncio.create_task(self.run_audio())
+        watch_task = asyncio.create_task(self.watch_parent())
+        try:
+            await asyncio.wait(
+                {audio_task, watch_task}, return_when=asyncio.FIRST_COMPLETED
+            )
+            if audio_task.done():
+                audio_task.result()  # ошибки захвата не глотаем
+        finally:
+            self.session_active = False
+            for task in (audio_task, watch_task):
+                task.cancel()
+            await asyncio.gather(
+                audio_task, watch_task, numpy_task, return_exceptions=True
+            )
+            self.send(("done", {name: getattr(self, name) for name in self.STATS}))
+
+
+def run_audio_process(options: dict, channel):
+    """Точка входа процесса захвата: свой event loop, без перевода и вывода"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C ловит основной процесс
+    try:
+        asyncio.run(AudioProcessStream(options, channel).run())
+    finally:
+        channel.close()
+
+
+class RealTimeSubtitles(DeepgramStream):
+    def __init__(
+        self,
+        source: str = "pulse",
+        speed: float | None = 1.0,
+        trace_path: str | None = None,
+        services: TranslationServices | None = None,
+        name: str | None = None,
+        target_langs: list[str] | None = None,
+        renderer: TerminalRenderer | None = None,
+        fps: float = RENDER_FPS,
+        outputs: list[str] | None = None,
+        broadcaster: SubtitleBroadcaster | None = None,
+        serve: str | None = None,
+        codec: str = UPSTREAM_CODEC,
+        overflow: str = OVERFLOW_POLICY,
+        fuzzy_cache: bool = FUZZY_CACHE_ENABLED,
+        capture_process: bool = CAPTURE_PROCESS,
+    ):
+        super().__init__(source, speed, codec, overflow, not capture_process)
+        self.capture_process = capture_process
+        # Имя сессии в многопоточном режиме; тогда interim не выводятся
+        # (но переводятся для --serve), а финалы печатаются с префиксом
+        self.name = name
+        self.partial_buffer = ""
+        self.initialized = False
+        # Терминал общий для всех сессий процесса; закрывает его создатель
+        self.owns_renderer = renderer is None
+        self.renderer = renderer or TerminalRenderer(fps)
+        # Раздача зрителям: своя по адресу ``serve`` или общая для процесса
+        self.owns_broadcaster = broadcaster is None and serve is not None
+        self.broadcaster = broadcaster or (
+            SubtitleBroadcaster(serve) if serve is not None else None
+        )
+
+        # Собственные ресурсы перевода закрываются вместе с сессией,
+        # общие — тем, кто их создал
+        self.owns_services = services is None
+        self.services = services or TranslationServices(fuzzy_cache)
+        self.translation_cache = self.services.translation_cache
+        self.fuzzy_index = self.services.fuzzy_index
+        self.disk_cache = self.services.disk_cache
+        self.batcher = self.services.batcher
+        self.cache_hits = 0
+        self.cache_lookups = 0
+        self.split_texts = 0  # транскрипты, переведённые по предложениям
+        self.split_sentences = 0
+
+        # Задержки по стадиям
+        self.latency = LatencyTracker(trace_path, session=name)
+
+        # Стадия перевода отделена от приёма результатов Deepgram: один
+        # транскрипт расходится по языкам, у каждого свои воркеры.
+        # interim переводятся только на первый язык — его строка на экране
+        # Файлы субтитров — на каждый язык свои (out.srt -> out.DE.srt)
+        target_langs = target_langs or [TARGET_LANG]
+        multilingual = len(target_langs) > 1
+        self.lanes = [
+            TranslationLane(
+                self,
+                lang,
+                f"[{lang}] " if multilingual else "",
+                (
+                    SubtitleWriter(
+                        [
+                            tagged_path(path, lang) if multilingual else path
+                            for path in outputs
+                        ]
+                    )
+                    if outputs
+                    else None
+                ),
+            )
+            for lang in target_langs
+        ]
+        self.last_final_seq = 0  # последний финал, поставленный в очередь
+
+        # Отсев interim, у которых изменился только хвост
+        self.stability = InterimStabilityTracker()
+        self.utterance_id = 0  # номер текущей фразы
+        self.deferred_interim: asyncio.TimerHandle | None = None
+        # interim, которые ждут SPECULATION_STABLE_TIME без изменений
+        self.speculation_timer: asyncio.TimerHandle | None = None
+        self.speculation_text = ""
+        self.speculations = 0
+        self.speculation_hits = 0
+        self.speculation_misses = 0
+        self.speculation_wasted_chars = 0
+        self.speculation_head_start = 0.0  # суммарный выигрыш попаданий, с
+        self.interims_received = 0
+        self.interims_skipped = 0
+        self.interims_over_quota = 0  # не переведены ради квоты DeepL
+        # Запросы к DeepL по фразам
+        self.utterance_api_calls: Counter[tuple[str, int]] = Counter()
+        self.calls_per_utterance: list[int] = []
+
+    def normalize_text(self, text: str) -> str:
+        """Нормализация текста для улучшения кэширования"""
+        # Убираем лишние пробелы
+        normalized = re.sub(r"\s+", " ", text.strip())
+        # Убираем завершающую пунктуацию для совпадения interim/final
+        normalized = re.sub(r"[.!?,;]+$", "", normalized)
+        return normalized.lower()
+
+    def redraw(
+        self,
+        text: str | None = None,
+        is_final: bool = False,
+        on_shown: Callable[[float], None] | None = None,
+    ):
+        if self.name is not None:
+            # Несколько сессий делят терминал: только финалы, по строке
+            if is_final and text:
+                self.renderer.commit(f"[{self.name}] {text}", on_shown)
+            return
+
+        if not self.initialized:
+            self.renderer.clear()
+            self.renderer.commit("Deepgram connection established")
+            self.initialized = True
+
+        if is_final and text:
+            self.renderer.commit(text, on_shown)
+        elif text:
+            self.renderer.show(text, on_shown)
+
+    def print_interim(self, text: str, on_shown: Callable[[float], None] | None = None):
+        self.partial_buffer = text
+        self.redraw(text=text, is_final=False, on_shown=on_shown)
+
+    def print_final(
+        self,
+        text: str,
+        lane: TranslationLane,
+        seq: int,
+        on_shown: Callable[[float], None] | None = None,
+    ) -> bool:
+        if not text or text in lane.final_buffer:
+            return False
+        lane.final_buffer.append(text)
+        # interim следующей фразы мог появиться раньше финала: финал
+        # затирает его строку, поэтому он выводится заново
+        interim = self.partial_buffer
+        self.redraw(text=lane.label + text, is_final=True, on_shown=on_shown)
+        self.partial_buffer = ""
+        if interim and self.lanes[0].shown_interim_seq > seq:
+            self.print_interim(interim)
+        return True
+
+    def record_when_shown(
+        self, segment: TranscriptSegment, translated: str
+    ) -> Callable[[float], None]:
+        """Записать задержку, когда кадр с субтитром записан в терминал"""
+        loop = asyncio.get_running_loop()
+
+        def on_shown(shown_at: float):
+            segment.shown_at = shown_at
+            try:
+                loop.call_soon_threadsafe(self.latency.record, segment, translated)
+            except RuntimeError:
+                pass  # кадр дорисован после остановки event loop
+
+        return on_shown
+
+    def cancel_deferred_interim(self):
+        if self.deferred_interim:
+            self.deferred_interim.cancel()
+            self.deferred_interim = None
+
+    def on_interim(self, segment: TranscriptSegment):
+        """Решить, переводить ли interim сразу, позже или не переводить"""
+        self.interims_received += 1
+        self.consider_speculation(segment)
+        if not self.interim_lanes():
+            return  # interim некому показать
+        self.cancel_deferred_interim()
+        # Квота DeepL на исходе: interim реже, а затем только финалы
+        level = self.services.quota.level
+        if level >= 2:
+            self.interims_over_quota += 1
+            return
+        self.stability.slowdown = QUOTA_INTERIM_SLOWDOWN if level else 1
+        now = time.monotonic()
+        if self.stability.update(segment.transcript, now):
+            self.submit_interim(segment)
+            return
+
+        self.interims_skipped += 1
+        # Если новых гипотез не будет, последняя уйдёт в перевод по debounce
+        self.deferred_interim = asyncio.get_running_loop().call_later(
+            self.stability.time_until_due(now), self.on_deferred_interim, segment
+        )
+
+    def consider_speculation(self, segment: TranscriptSegment):
+        """Спекулировать на interim, похожем на конец фразы.
+
+        Признаки: гипотеза кончается знаком конца предложения или не
+        меняется SPECULATION_STABLE_TIME. ``speech_final`` Deepgram приходит
+        только вместе с финалом, поэтому раньше финала не помогает.
+        """
+        if not SPECULATION_ENABLED or self.services.quota.level:
+            return  # на исходе квоты промахи слишком дороги
+        normalized = self.normalize_text(segment.transcript)
+        if self.speculation_timer and normalized == self.speculation_text:
+            return  # гипотеза не изменилась — таймер продолжает идти
+        self.cancel_speculation_timer()
+        if re.search(r"[.!?…][\"')\]]*$", segment.transcript.rstrip()):
+            self.speculate(segment)
+            return
+        self.speculation_text = normalized
+        self.speculation_timer = asyncio.get_running_loop().call_later(
+            SPECULATION_STABLE_TIME, self.speculate, segment
+        )
+
+    def cancel_speculation_timer(self):
+        if self.speculation_timer:
+            self.speculation_timer.cancel()
+            self.speculation_timer = None
+
+    def speculate(self, segment: TranscriptSegment):
+        self.speculation_timer = None
+        if segment.seq <= self.last_final_seq:
+            return
+        segment.utterance = self.utterance_id
+        for lane in self.lanes:
+            lane.speculate(segment)
+
+    def speculation_wasted(self, speculation: Speculation):
+        self.speculation_misses += 1
+        self.speculation_wasted_chars += speculation.chars
+
+    def is_cached(self, text: str, target_lang: str) -> bool:
+        """Все предложения текста уже есть в кэше памяти"""
+        return all(
+            f"{target_lang}:{self.normalize_text(sentence)}" in self.translation_cache
+            for sentence in split_sentences(text)
+        )
+
+    def on_deferred_interim(self, segment: TranscriptSegment):
+        self.deferred_interim = None
+        if segment.seq > self.last_final_seq and not self.stability.is_requested(
+            segment.transcript
+        ):
+            self.interims_skipped -= 1
+            self.submit_interim(segment)
+
+    def interim_lanes(self) -> list[TranslationLane]:
+        """Языки, для которых переводятся interim.
+
+        Терминал показывает interim только первого языка и только у
+        единственной сессии, а зрители ``--serve`` получают все.
+        """
+        if self.broadcaster:
+            return self.lanes
+        return self.lanes[:1] if self.name is None else []
+
+    def submit_interim(self, segment: TranscriptSegment):
+        """Заменить ожидающую interim-гипотезу на более свежую"""
+        self.stability.mark_requested(time.monotonic())
+        segment.utterance = self.utterance_id
+        for lane in self.interim_lanes():
+            lane.submit_interim(segment)
+
+    def submit_final(self, segment: TranscriptSegment):
+        """Поставить финальную фразу в очередь перевода"""
+        self.last_final_seq = segment.seq
+        self.cancel_deferred_interim()
+        self.cancel_speculation_timer()
+        segment.utterance = self.utterance_id
+        for lane in self.lanes:
+            lane.submit_final(segment)
+        self.utterance_id += 1
+        self.stability.reset()
+
+    async def translate_text(
+        self,
+        text: str,
+        target_lang: str = TARGET_LANG,
+        context: str = "",
+        utterance: int | None = None,
+        priority: int = PRIORITY_FINAL,
+    ) -> str:
+        """Перевод с кэшем; при ошибке — исходный текст.
+
+        Несколько предложений переводятся и кэшируются по одному, с
+        предыдущими предложениями в контексте: когда меняется хвост длинной
+        гипотезы, готовые предложения берутся из кэша. interim, снятый
+        планировщиком DeepL, поднимает ``RequestShed``.
+        """
+        text = text.strip()
+        if not text:
+            return ""
+
+        sentences = split_sentences(text)
+        if len(sentences) == 1:
+            return await self.translate_sentence(
+                text, target_lang, context, utterance, priority
+            )
+        self.split_texts += 1
+        self.split_sentences += len(sentences)
+        translations = await asyncio.gather(
+            *(
+                self.translate_sentence(
+                    sentence,
+                    target_lang,
+                    " ".join([context, *sentences[:index]]).strip(),
+                    utterance,
+                    priority,
+                )
+                for index, sentence in enumerate(sentences)
+            )
+        )
+        return " ".join(translations)
+
+    async def translate_sentence(
+        self,
+        text: str,
+        target_lang: str,
+        context: str,
+        utterance: int | None,
+        priority: int,
+    ) -> str:
+        # Проверка кэша с нормализацией; у каждого языка своё пространство ключей
+        normalized = self.normalize_text(text)
+        cache_key = f"{target_lang}:{normalized}"
+        self.cache_lookups += 1
+        cached = self.translation_cache.get(cache_key)
+        if cached is None and self.disk_cache:
+            cached = self.disk_cache.get(TRANSLATION_LANG, target_lang, normalized)
+            if cached is not None:
+                self.translation_cache.put(cache_key, cached)
+                if self.fuzzy_index:
+                    self.fuzzy_index.add(target_lang, cache_key, normalized)
+        if cached is None and self.fuzzy_index:
+            # Финалам (и спекуляциям на них) — строгий порог
+            cached = self.fuzzy_index.lookup(
+                target_lang,
+                normalized,
+                (
+                    FUZZY_FINAL_MAX_DISTANCE
+                    if priority < PRIORITY_INTERIM
+                    else FUZZY_INTERIM_MAX_DISTANCE
+                ),
+                self.translation_cache,
+            )
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+
+        if utterance is not None:
+            self.utterance_api_calls[(target_lang, utterance)] += 1
+
+        try:
+            translated = await self.batcher.translate(
+                text, target_lang, context, priority
+            )
+
+            # Кэшируем результат
+            self.translation_cache.put(cache_key, translated)
+            if self.fuzzy_index:
+                self.fuzzy_index.add(target_lang, cache_key, normalized)
+            if self.disk_cache:
+                self.disk_cache.put(
+                    TRANSLATION_LANG, target_lang, normalized, translated
+                )
+
+            return translated
+
+        except RequestShed:
+            raise
+        except (httpx.TimeoutException, httpx.HTTPStatusError):
+            # DeepL недоступен или 429 не прошёл после повторов — оригинал
+            return text
+        except Exception as e:
+            print(f"[Translation error]: {e}")
+            return text
+
+    async def process_audio_stream(self):
+        self.session_active = True
+        loop = asyncio.get_running_loop()
+
+        # kill -USR1 <pid> печатает статистику, не прерывая сессию
+        if self.name is None and hasattr(signal, "SIGUSR1"):
+            loop.add_signal_handler(signal.SIGUSR1, self.print_stats)
+
+        # Всё, что нужно до первого субтитра, стартует одновременно: прогрев
+        # DeepL, numpy, захват (с поиском монитора PulseAudio) и соединение
+        # с Deepgram в run_audio
+        self.started_at = time.monotonic()
+        if self.owns_services:
+            self.services.start()
+        numpy_task = asyncio.create_task(asyncio.to_thread(load_numpy))
+        if self.owns_broadcaster:
+            await self.broadcaster.start()
+        workers = [
+            asyncio.create_task(worker)
+            for lane in self.lanes
+            for worker in (lane.final_worker(), lane.interim_worker())
+        ]
+
+        try:
+            if self.capture_process:
+                await self.run_capture_process()
+            else:
+                await self.run_audio()
+            # Звук закончился: дожидаемся перевода оставшихся финалов
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(*(lane.final_queue.join() for lane in self.lanes)),
+                    DRAIN_TIMEOUT,
+                )
+            except asyncio.TimeoutError:
+                pass
+        finally:
+            self.session_active = False
+            self.cancel_speculation_timer()
+            for worker in workers:
+                worker.cancel()
+            for lane in self.lanes:
+                if lane.speculation:
+                    lane.speculation.task.cancel()
+            await asyncio.gather(numpy_task, *workers, return_exceptions=True)
+            if self.owns_services:
+                await self.services.aclose()
+            if self.owns_renderer:
+                self.renderer.close()
+            if self.owns_broadcaster:
+                await self.broadcaster.stop()
+            for lane in self.lanes:
+                if lane.writer:
+                    lane.writer.close()
+            self.latency.close()
+
+    async def run_capture_process(self):
+        """Звук — в процессе захвата (run_audio_process), результаты — сюда.
+
+        Канал читает отдельный поток, поэтому процесс захвата не ждёт, пока
+        занят event loop перевода и отрисовки. По завершении процесс
+        присылает статистику своей стороны для print_stats.
+        """
+        loop = asyncio.get_running_loop()
+        context = multiprocessing.get_context("spawn")
+        receiver, sender = context.Pipe(duplex=False)
+        options = {
+            "source": self.source,
+            "speed": self.speed,
+            "codec": self.codec,
+            "overflow": self.overflow,
+            "listen_url": self.listen_url(),
+            "started_at": self.started_at,
+        }
+        process = context.Process(
+            target=run_audio_process,
+            args=(options, sender),
+            name="rt_6-audio",
+            daemon=True,
+        )
+        inbox: asyncio.Queue[tuple[str, object]] = asyncio.Queue()
+
+        def read_channel():
+            while True:
+                try:
+                    message = receiver.recv()
+                except (EOFError, OSError):
+                    message = ("done", {})  # процесс захвата завершился сам
+                try:
+                    loop.call_soon_threadsafe(inbox.put_nowait, message)
+                except RuntimeError:
+                    return  # event loop уже закрыт
+                if message[0] == "done":
+                    return
+
+        try:
+            process.start()
+            sender.close()  # иначе EOF не придёт, если процесс захвата упадёт
+            threading.Thread(
+                target=read_channel, name="rt_6-audio-channel", daemon=True
+            ).start()
+            while True:
+                kind, payload = await inbox.get()
+                if kind == "done":
+                    for name, value in payload.items():
+                        setattr(self, name, value)
+                    return
+                if payload.is_final:
+                    self.submit_final(payload)
+                else:
+                    self.on_interim(payload)
+        finally:
+            if process.is_alive():
+                process.terminate()
+            await asyncio.to_thread(process.join)
+
+    def capture_seconds(self, stream_seconds: float) -> float:
+        if self.capture_process:
+            return stream_seconds  # пересчитано в процессе захвата
+        return super().capture_seconds(stream_seconds)
+
+    def print_stats(self):
+        """Сводка по сессии"""
+        self.latency.print_summary()
+        first = self.latency.first
+        if first and first.shown_at and self.started_at:
+            shown = first.shown_at
+            startup = [f"first subtitle {(shown - self.started_at) * 1000:.0f}ms"]
+            if first.captured_at:
+                startup.append(
+                    f"its end-to-end {(shown - first.captured_at) * 1000:.0f}ms"
+                )
+            if self.connect_time is not None:
+                startup.append(f"Deepgram connect {self.connect_time * 1000:.0f}ms")
+            print(f"[Stats] startup: {', '.join(startup)}")
+        if self.captured_bytes and self.started_at:
+            audio_seconds = self.captured_bytes / BYTES_PER_SECOND
+            wall = time.monotonic() - self.started_at
+            print(
+                f"[Stats] audio: {audio_seconds:.1f}s in {wall:.1f}s "
+                f"({audio_seconds / wall:.2f}x real time)"
+            )
+        if self.upstream_bytes and self.send_cursor:
+            pcm_seconds = self.send_cursor / BYTES_PER_SECOND
+            print(
+                f"[Stats] upstream: {self.upstream_bytes / 1024:.0f} KiB {self.codec}, "
+                f"{self.upstream_bytes * 8 / 1000 / pcm_seconds:.0f} kbit/s "
+                f"({self.upstream_bytes / self.send_cursor:.1%} of PCM)"
+            )
+        if self.send_lag.count:
+            print(
+                f"[Stats] send queue: max depth {self.max_queue_depth:.1f}s, "
+                f"capture-to-send lag p50 {self.send_lag.percentile(0.5) * 1000:.0f}ms "
+                f"p99 {self.send_lag.percentile(0.99) * 1000:.0f}ms "
+                f"max {self.send_lag.max * 1000:.0f}ms"
+                + (
+                    f", {self.overflow}: dropped "
+                    f"{self.dropped_bytes / BYTES_PER_SECOND:.1f}s of audio"
+                    if self.dropped_bytes
+                    else ""
+                )
+                + (
+                    f", {self.overflow}: skipped "
+                    f"{self.skipped_bytes / BYTES_PER_SECOND:.1f}s of silence"
+                    if self.skipped_bytes
+                    else ""
+                )
+            )
+        if self.cache_lookups:
+            print(
+                f"[Stats] cache lookups: {self.cache_lookups}, "
+                f"hit rate {self.cache_hits / self.cache_lookups:.1%}"
+            )
+        if self.speculations:
+            hits = self.speculation_hits
+            print(
+                f"[Stats] speculation: {self.speculations} started, {hits} hits "
+                f"({hits / self.speculations:.1%}), {self.speculation_misses} "
+                f"wasted ({self.speculation_wasted_chars} chars)"
+                + (
+                    f", head start avg "
+                    f"{self.speculation_head_start / hits * 1000:.0f}ms"
+                    if hits
+                    else ""
+                )
+            )
+        if self.split_texts:
+            print(
+                f"[Stats] transcripts split into sentences: {self.split_texts}, "
+                f"{self.split_sentences / self.split_texts:.1f} sentences each"
+            )
+        calls = self.calls_per_utterance  # по фразе на каждый язык
+        if calls:
+            languages = len(self.lanes)
+            per = "utterance" if languages == 1 else "utterance and language"
+            print(
+                f"[Stats] utterances: {len(calls) // languages}"
+                + (f" x {languages} languages" if languages > 1 else "")
+                + f", DeepL calls per {per}: avg {sum(calls) / len(calls):.2f}, "
+                f"max {max(calls)}"
+            )
+        if self.vad and self.vad.captured_bytes:
+            print(
+                f"[Stats] VAD: suppressed {self.vad.suppressed_fraction:.1%} "
+                f"of captured audio"
+            )
+        if self.reconnects:
+            print(
+                f"[Stats] reconnects: {self.reconnects}, "
+                f"total {self.reconnect_time:.1f}s, "
+                f"replayed {self.replayed_bytes / BYTES_PER_SECOND:.1f}s of audio, "
+                f"duplicate finals dropped: {self.duplicates_dropped}"
+            )
+        if self.interims_received and self.name is None:
+            print(
+                f"[Stats] interims: {self.interims_received}, "
+                f"skipped as unstable: {self.interims_skipped}"
+                + (
+                    f", over DeepL quota: {self.interims_over_quota}"
+                    if self.interims_over_quota
+                    else ""
+                )
+            )
+        if self.owns_renderer and self.renderer.frames:
+            print_renderer_stats(self.renderer)
+        if self.owns_broadcaster:
+            self.broadcaster.print_stats()
+        if self.owns_services:
+            self.services.print_stats()
+
+    def run(self):
+        try:
+            asyncio.run(self.process_audio_stream())
+        except KeyboardInterrupt:
+            self.session_active = False
+            print("\nInterrupted")
+        finally:
+            self.print_stats()
+
+
+def print_renderer_stats(renderer: TerminalRenderer):
+    print(
+        f"[Stats] renderer: {renderer.updates} updates in {renderer.frames} "
+        f"frames, {renderer.bytes_written / 1024:.1f} KiB written"
+    )
+
+
+async def run_sessions(
+    sources: list[str],
+    speed: float | None,
+    trace_path: str | None = None,
+    target_langs: list[str] | None = None,
+    fps: float = RENDER_FPS,
+    outputs: list[str] | None = None,
+    serve: str | None = None,
+    codec: str = UPSTREAM_CODEC,
+    overflow: str = OVERFLOW_POLICY,
+    fuzzy_cache: bool = FUZZY_CACHE_ENABLED,
+    capture_process: bool = CAPTURE_PROCESS,
+):
+    """Несколько независимых конвейеров на одном event loop.
+
+    Каждый источник получает свою сессию (захват, VAD, соединение с
+    Deepgram, очереди перевода), а пул соединений DeepL, кэш переводов и
+    лимит запросов общие. С ``capture_process`` у каждой сессии свой
+    процесс захвата.
+    """
+    services = TranslationServices(fuzzy_cache)
+    renderer = TerminalRenderer(fps)
+    broadcaster = SubtitleBroadcaster(serve) if serve else None
+    names = [f"{i + 1}:{os.path.basename(source)}" for i, source in enumerate(sources)]
+    sessions = [
+        RealTimeSubtitles(
+            source,
+            speed,
+            trace_path,
+            services=services,
+            name=name,
+            target_langs=target_langs,
+            renderer=renderer,
+            outputs=[tagged_path(path, str(index)) for path in outputs or []],
+            broadcaster=broadcaster,
+            codec=codec,
+            overflow=overflow,
+            capture_process=capture_process,
+        )
+        for index, (source, name) in enumerate(zip(sources, names), 1)
+    ]
+
+    def print_all_stats():
+        for session in sessions:
+            print(f"--- session {session.name}")
+            session.print_stats()
+        print("--- shared")
+        services.print_stats()
+        if renderer.frames:
+            print_renderer_stats(renderer)
+        if broadcaster:
+            broadcaster.print_stats()
+
+    if hasattr(signal, "SIGUSR1"):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, print_all_stats)
+    try:
+        services.start()
+        if broadcaster:
+            await broadcaster.start()
+        await asyncio.gather(*(session.process_audio_stream() for session in sessions))
+    finally:
+        if broadcaster:
+            await broadcaster.stop()
+        await services.aclose()
+        renderer.close()
+        print_all_stats()
+
+
+class BatchPiece(RealTimeSubtitles):
+    """Кусок записи в пакетном режиме.
+
+    Звук берётся без ограничения темпа из диапазона общего PCM-файла,
+    interim не переводятся, а финалы собираются в ``cues`` со временем от
+    начала всей записи. Ресурсы перевода общие для всех кусков.
+    """
+
+    def __init__(self, pcm_path: str, start: int, end: int, **kwargs):
+        super().__init__(source=pcm_path, speed=None, **kwargs)
+        self.range = (start, end)
+        self.offset = start / BYTES_PER_SECOND
+        self.cues: list[SubtitleCue] = []
+        for lane in self.lanes:
+            lane.writer = self  # финалы приходят в write()
+
+    def open_audio(self):
+        return read_pcm_range(self.source, *self.range)
+
+    def redraw(
+        self,
+        text: str | None = None,
+        is_final: bool = False,
+        on_shown: Callable[[float], None] | None = None,
+    ):
+        # Вывод — после слияния всех кусков; задержка — до готового финала
+        if on_shown:
+            on_shown(time.monotonic())
+
+    def consider_speculation(self, segment: TranscriptSegment):
+        pass  # спекуляция сокращает задержку, а не время обработки
+
+    def write(self, cue: SubtitleCue):
+        self.cues.append(
+            replace(
+                cue,
+                start=cue.start + self.offset,
+                end=cue.end + self.offset,
+                session=None,
+            )
+        )
+
+    def close(self):
+        pass
+
+
+async def split_recording(
+    source: str, pcm_path: str, piece_seconds: float = BATCH_PIECE_SECONDS
+) -> tuple[list[tuple[int, int]], int]:
+    """Декодировать запись в PCM-файл и разрезать по паузам.
+
+    Набрав ``piece_seconds`` звука, кусок закрывается, как только тишина
+    продлится BATCH_MIN_SILENCE — разрез посередине этой тишины; без пауз
+    кусок режется на двойной длине.
+    Возвращает диапазоны кусков (байты) и размер всей записи.
+    """
+    gate = VoiceActivityGate()
+    target = stream_offset(piece_seconds)
+    min_silence = stream_offset(BATCH_MIN_SILENCE)
+    pieces: list[tuple[int, int]] = []
+    start = position = silence = 0
+    with open(pcm_path, "wb") as out:
+        async for chunk in open_audio_source(source):
+            out.write(chunk)
+            position += len(chunk)
+            silence = 0 if gate.is_speech(chunk) else silence + len(chunk)
+            length = position - start
+            if (length >= target and silence >= min_silence) or length >= 2 * target:
+                cut = position - silence // 2
+                cut -= cut % FRAME_SIZE
+                pieces.append((start, cut))
+                start = cut
+    if position > start:
+        pieces.append((start, position))
+    return pieces, position
+
+
+async def run_batch(
+    source: str,
+    connections: int = BATCH_CONNECTIONS,
+    trace_path: str | None = None,
+    target_langs: list[str] | None = None,
+    outputs: list[str] | None = None,
+    codec: str = UPSTREAM_CODEC,
+    fuzzy_cache: bool = FUZZY_CACHE_ENABLED,
+):
+    """Перевести запись целиком быстрее реального времени.
+
+    Куски распознаются по ``connections`` параллельным соединениям с
+    Deepgram, переводы идут через общий batcher DeepL, а финалы всех
+    кусков сливаются по времени в один транскрипт и файлы субтитров.
+    """
+    started = time.monotonic()
+    load_numpy()
+    services = TranslationServices(fuzzy_cache)
+    services.start()
+    renderer = TerminalRenderer()
+    target_langs = target_langs or [TARGET_LANG]
+    limit = asyncio.Semaphore(connections)
+
+    async def run_piece(piece: BatchPiece):
+        async with limit:
+            await piece.process_audio_stream()
+
+    pieces: list[BatchPiece] = []
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            pcm_path = os.path.join(tmp, "recording.s16le")
+            ranges, total = await split_recording(source, pcm_path)
+            decoded = time.monotonic()
+            pieces = [
+                BatchPiece(
+                    pcm_path,
+                    start,
+                    end,
+                    trace_path=trace_path,
+                    services=services,
+                    name=str(index),
+                    target_langs=target_langs,
+                    renderer=renderer,
+                    codec=codec,
+                )
+                for index, (start, end) in enumerate(ranges, 1)
+            ]
+            await asyncio.gather(*(run_piece(piece) for piece in pieces))
+    finally:
+        await services.aclose()
+        renderer.close()
+
+    cues = sorted(
+        (cue for piece in pieces for cue in piece.cues),
+        key=lambda cue: (cue.start, target_langs.index(cue.target_lang)),
+    )
+    multilingual = len(target_langs) > 1
+    for lang in target_langs:
+        if not outputs:
+            break
+        writer = SubtitleWriter(
+            [tagged_path(path, lang) if multilingual else path for path in outputs]
+        )
+        for cue in cues:
+            if cue.target_lang == lang:
+                writer.write(cue)
+        writer.close()
+    if not outputs:
+        for cue in cues:
+            stamp = SubtitleSink.timestamp(cue.start, ".")
+            label = f"[{cue.target_lang}] " if multilingual else ""
+            print(f"{stamp} {label}{cue.text}")
+
+    wall = time.monotonic() - started
+    audio_seconds = total / BYTES_PER_SECOND
+    print(
+        f"[Batch] {audio_seconds:.1f}s of audio in {wall:.1f}s "
+        f"({audio_seconds / wall:.1f}x real time): {len(pieces)} pieces over "
+        f"{connections} connections, decoding {decoded - started:.1f}s, "
+        f"{len(cues)} subtitles"
+    )
+    reconnects = sum(piece.reconnects for piece in pieces)
+    if reconnects:
+        print(f"[Batch] Deepgram reconnects: {reconnects}")
+    services.print_stats()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Real-time English speech to Russian subtitles"
+    )
+    parser.add_argument(
+        "--source",
+        action="append",
+        type=parse_source,
+        help="pulse (system audio, default), '-' for s16le on stdin, a named "
+        "pipe, a WAV/raw PCM file or any file ffmpeg can decode; repeat to run "
+        "several sessions in one process",
+    )
+    parser.add_argument(
+        "--pace",
+        type=parse_pace,
+        default=1.0,
+        help="playback speed for file, pipe and stdin sources: realtime, "
+        "fast (unthrottled) or a factor such as 4 (default: realtime)",
+    )
+    parser.add_argument(
+        "--target",
+        action="append",
+        type=str.upper,
+        help=f"DeepL target language (default: {TARGET_LANG}); repeat to "
+        "translate one transcription into several languages",
+    )
+    parser.add_argument(
+        "--fps",
+        type=float,
+        default=RENDER_FPS,
+        help=f"maximum subtitle redraws per second (default: {RENDER_FPS:g})",
+    )
+    parser.add_argument(
+        "--output",
+        action="append",
+        type=parse_output,
+        help="also write final subtitles to this .srt, .vtt or .jsonl file; "
+        "repeatable (with several sources or targets the session number and "
+        "language are added to the name)",
+    )
+    parser.add_argument(
+        "--serve",
+        metavar="[HOST:]PORT",
+        help="serve subtitles to viewers over websocket (/ws), SSE (/events) "
+        "and an overlay page (/) on this address; viewers get interims for "
+        "every feed and language",
+    )
+    parser.add_argument(
+        "--codec",
+        choices=["linear16", "opus", "flac"],
+        default=UPSTREAM_CODEC,
+        help="compress audio sent to Deepgram with ffmpeg (default: "
+        f"{UPSTREAM_CODEC}); Ogg/Opus needs ~10x less upstream bandwidth",
+    )
+    parser.add_argument(
+        "--overflow",
+        choices=OVERFLOW_POLICIES,
+        default=OVERFLOW_POLICY,
+        help=f"what to do when more than {SEND_QUEUE_SECONDS:g}s of live audio "
+        "waits to be sent: drop the oldest audio, stop queueing silence, "
+        f"or keep everything (default: {OVERFLOW_POLICY})",
+    )
+    parser.add_argument(
+        "--fuzzy-cache",
+        action="store_true",
+        default=FUZZY_CACHE_ENABLED,
+        help="reuse cached translations of near-identical transcripts (filler "
+        "words, punctuation, one changed word in an interim)",
+    )
+    parser.add_argument(
+        "--capture-process",
+        action="store_true",
+        default=CAPTURE_PROCESS,
+        help="capture and send audio in a separate process, so a busy "
+        "translation or terminal does not delay audio going to Deepgram",
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="translate a recording as fast as possible: split it at pauses "
+        "and recognise the pieces over several Deepgram connections",
+    )
+    parser.add_argument(
+        "--connections",
+        type=int,
+        default=BATCH_CONNECTIONS,
+        help=f"parallel Deepgram connections for --batch (default: "
+        f"{BATCH_CONNECTIONS})",
+    )
+    parser.add_argument(
+        "--trace", help="append per-subtitle stage timestamps to this JSONL file"
+    )
+    args = parser.parse_args()
+    sources = args.source or ["pulse"]
+
+    if args.batch:
+        if len(sources) > 1 or sources[0] == "pulse":
+            parser.error("--batch needs exactly one recorded --source")
+        if args.connections < 1:
+            parser.error("--connections must be at least 1")
+        try:
+            asyncio.run(
+                run_batch(
+                    sources[0],
+                    args.connections,
+                    args.trace,
+                    args.target,
+                    args.output,
+                    args.codec,
+                    args.fuzzy_cache,
+                )
+            )
+        except KeyboardInterrupt:
+            print("\nInterrupted")
+    elif len(sources) > 1:
+        try:
+            asyncio.run(
+                run_sessions(
+                    sources,
+                    args.pace,
+                    args.trace,
+                    args.target,
+                    args.fps,
+                    args.output,
+                    args.serve,
+                    args.codec,
+                    args.overflow,
+                    args.fuzzy_cache,
+                    args.capture_process,
+                )
+            )
+        except KeyboardInterrupt:
+            print("\nInterrupted")
+    else:
+        translator = RealTimeSubtitles(
+            source=sources[0],
+            speed=args.pace,
+            trace_path=args.trace,
+            target_langs=args.target,
+            fps=args.fps,
+            outputs=args.output,
+            serve=args.serve,
+            codec=args.codec,
+            overflow=args.overflow,
+            fuzzy_cache=args.fuzzy_cache,
+            capture_process=args.capture_process,
+        )
+        translator.run()
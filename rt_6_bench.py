@@ -0,0 +1,278 @@
+"""Бенчмарк rt_6.py на локальных заглушках Deepgram и DeepL.
+
+Синтетическая запись (тон вместо речи, паузы между фразами) проходит через
+весь конвейер RealTimeSubtitles. Для каждого сценария печатаются задержки
+субтитров и число обращений к API:
+
+    python rt_6_bench.py
+    python rt_6_bench.py --scenario slow-deepl --pace 4 --json result.json
+    python rt_6_bench.py --scenario baseline --codec linear16 --codec opus
+    python rt_6_bench.py --scenario slow-deepl --capture-process
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import struct
+import tempfile
+import time
+import wave
+
+import rt_6
+import rt_6_stubs
+
+# Параметры заглушек для каждого сценария (поверх значений по умолчанию)
+SCENARIOS: dict[str, dict[str, float | str]] = {
+    "baseline": {},
+    "slow-deepl": {"deepl_latency": "lognormal:300,0.5"},  # p95 ~ 700 мс
+    "rate-limited": {"deepl_429_rate": 0.1},
+    "deepl-errors": {"deepl_error_rate": 0.05},
+    "flaky-asr": {"asr_error_rate": 0.01, "asr_429_rate": 0.2},
+}
+LEAD_SILENCE = 0.5  # секунды тишины в начале записи
+GAP_SILENCE = 1.5  # секунды тишины между фразами
+
+
+def generate_recording(path: str, sentences: int) -> list[tuple[float, float]]:
+    """Записать WAV со сценарием; возвращает (начало, конец) каждой фразы"""
+    script = rt_6_stubs.DEFAULT_SCRIPT
+    segments = []
+    frames = bytearray()
+
+    def silence(seconds: float):
+        frames.extend(bytes(int(seconds * rt_6.SAMPLE_RATE) * 2))
+
+    silence(LEAD_SILENCE)
+    for i in range(sentences):
+        index = i % len(script)
+        words = len(script[index].split())
+        duration = math.ceil(words * rt_6_stubs.WORD_DURATION / rt_6.CHUNK_DURATION)
+        duration *= rt_6.CHUNK_DURATION
+        frequency = rt_6_stubs.SENTENCE_BASE_HZ + index * rt_6_stubs.SENTENCE_STEP_HZ
+        start = len(frames) / rt_6.BYTES_PER_SECOND
+        samples = int(duration * rt_6.SAMPLE_RATE)
+        step = 2 * math.pi * frequency / rt_6.SAMPLE_RATE
+        frames.extend(
+            struct.pack(
+                f"<{samples}h",
+                *(int(3000 * math.sin(n * step)) for n in range(samples)),
+            )
+        )
+        segments.append((start, start + duration))
+        silence(GAP_SILENCE)
+
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(rt_6.CHANNELS)
+        wav.setsampwidth(2)
+        wav.setframerate(rt_6.SAMPLE_RATE)
+        wav.writeframes(frames)
+    return segments
+
+
+class BenchSubtitles(rt_6.RealTimeSubtitles):
+    """RealTimeSubtitles без вывода в терминал, с отметками времени показа"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.disk_cache = None  # общий кэш исказил бы сравнение
+        self.shown: list[tuple[float, bool, str]] = []
+
+    def redraw(self, text: str | None = None, is_final: bool = False):
+        if text:
+            self.shown.append((time.monotonic(), is_final, text))
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return math.nan
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def strip_tag(text: str) -> str:
+    """Убрать метку языка, которую добавляет заглушка DeepL"""
+    return text.split("] ", 1)[1] if text.startswith("[") else text
+
+
+def measure(
+    translator: BenchSubtitles,
+    segments: list[tuple[float, float]],
+    sentences: list[str],
+    speed: float,
+) -> dict[str, float]:
+    """Сопоставить показанные субтитры фразам записи"""
+    started = translator.started_at
+    first_text: list[float] = []
+    final_latency: list[float] = []
+    untranslated = 0
+    current = 0
+    seen_interim = False
+    for shown_at, is_final, text in translator.shown:
+        if current >= len(segments):
+            break
+        start, end = segments[current]
+        if not is_final:
+            if not seen_interim:
+                first_text.append(shown_at - (started + start / speed))
+                seen_interim = True
+            continue
+        expected = translator.normalize_text(sentences[current])
+        if translator.normalize_text(strip_tag(text)) != expected:
+            continue
+        if not seen_interim:
+            first_text.append(shown_at - (started + start / speed))
+        final_latency.append(shown_at - (started + end / speed))
+        untranslated += text == strip_tag(text)  # показан английский текст
+        current += 1
+        seen_interim = False
+
+    shown = translator.shown
+    return {
+        "first_subtitle_ms": (shown[0][0] - started) * 1000 if shown else math.nan,
+        "finals_shown": len(final_latency),
+        "finals_expected": len(segments),
+        "finals_untranslated": untranslated,
+        "final_p50_ms": percentile(final_latency, 0.5) * 1000,
+        "final_p90_ms": percentile(final_latency, 0.9) * 1000,
+        "final_max_ms": max(final_latency, default=math.nan) * 1000,
+        "first_text_p50_ms": percentile(first_text, 0.5) * 1000,
+        "first_text_p90_ms": percentile(first_text, 0.9) * 1000,
+    }
+
+
+async def run_scenario(name: str, args, codec: str) -> dict[str, float]:
+    options = {
+        "asr_latency": args.asr_latency,
+        "asr_error_rate": args.asr_error_rate,
+        "asr_429_rate": args.asr_429_rate,
+        "deepl_latency": args.deepl_latency,
+        "deepl_error_rate": args.deepl_error_rate,
+        "deepl_429_rate": args.deepl_429_rate,
+        **SCENARIOS[name],
+    }
+    rng = random.Random(args.seed)
+    deepgram = rt_6_stubs.DeepgramStub(
+        rt_6_stubs.LatencyModel(str(options["asr_latency"]), rng),
+        error_rate=float(options["asr_error_rate"]),
+        reject_rate=float(options["asr_429_rate"]),
+        seed=args.seed,
+    )
+    deepl = rt_6_stubs.DeepLStub(
+        rt_6_stubs.LatencyModel(str(options["deepl_latency"]), rng),
+        error_rate=float(options["deepl_error_rate"]),
+        rate_limit_rate=float(options["deepl_429_rate"]),
+        seed=args.seed,
+    )
+    rt_6.DEEPGRAM_URL, rt_6.DEEPL_URL, stop = await rt_6_stubs.start_stubs(
+        deepgram, deepl
+    )
+    rt_6.DEEPL_USAGE_URL = rt_6.DEEPL_URL.rsplit("/", 1)[0] + "/usage"
+    # Символы заглушки не должны попасть в счётчик квоты настоящего ключа
+    rt_6.DEEPL_USAGE_DB = None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.wav")
+        segments = generate_recording(path, args.sentences)
+        script = rt_6_stubs.DEFAULT_SCRIPT
+        sentences = [script[i % len(script)] for i in range(args.sentences)]
+        translator = BenchSubtitles(
+            source=path,
+            speed=args.pace,
+            codec=codec,
+            capture_process=args.capture_process,
+        )
+        try:
+            await translator.process_audio_stream()
+        finally:
+            await stop()
+
+    result = measure(translator, segments, sentences, args.pace)
+    result.update(
+        {
+            "deepgram_connections": deepgram.stats.connections,
+            "deepgram_rejected": deepgram.stats.rejected,
+            "deepgram_dropped": deepgram.stats.dropped,
+            "audio_kib_sent": deepgram.stats.audio_bytes / 1024,
+            "upstream_kbit_s": deepgram.stats.audio_bytes
+            * 8
+            / 1000
+            / max(translator.send_cursor / rt_6.BYTES_PER_SECOND, 1e-9),
+            "send_lag_p99_ms": translator.send_lag.percentile(0.99) * 1000,
+            "speculation_hits": translator.speculation_hits,
+            "speculation_wasted": translator.speculation_misses,
+            "deepl_requests": deepl.stats.translate_requests,
+            "deepl_texts": deepl.stats.translated_texts,
+            "deepl_chars": deepl.stats.translated_chars,
+            "deepl_429": deepl.stats.rate_limited,
+            "deepl_errors": deepl.stats.errors,
+        }
+    )
+    if args.verbose:
+        translator.print_stats()
+    return result
+
+
+def print_report(results: dict[str, dict[str, float]]):
+    names = list(results)
+    metrics = list(results[names[0]])
+    width = max(len(m) for m in metrics)
+    column = max(14, *(len(n) for n in names))
+    print(f"{'':{width}}  " + "  ".join(f"{n:>{column}}" for n in names))
+    for metric in metrics:
+        cells = []
+        for name in names:
+            value = results[name][metric]
+            cells.append(
+                f"{value:>{column}.1f}"
+                if isinstance(value, float)
+                else f"{value:>{column}}"
+            )
+        print(f"{metric:{width}}  " + "  ".join(cells))
+
+
+async def main(args):
+    results = {}
+    codecs = args.codec or [rt_6.UPSTREAM_CODEC]
+    for name in args.scenario or list(SCENARIOS):
+        for codec in codecs:
+            label = name if len(codecs) == 1 else f"{name}/{codec}"
+            print(f"Running scenario {label}...")
+            results[label] = await run_scenario(name, args, codec)
+    print_report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="End-to-end latency benchmark for rt_6.py on local stubs"
+    )
+    parser.add_argument(
+        "--scenario", action="append", choices=list(SCENARIOS), help="repeatable"
+    )
+    parser.add_argument("--sentences", type=int, default=12)
+    parser.add_argument(
+        "--pace",
+        type=float,
+        default=1.0,
+        help="playback speed of the recording (1 = real time)",
+    )
+    parser.add_argument(
+        "--codec",
+        action="append",
+        choices=["linear16", "opus", "flac"],
+        help="upstream audio codec; repeat to compare (needs ffmpeg)",
+    )
+    parser.add_argument(
+        "--capture-process",
+        action="store_true",
+        help="capture and send audio in a separate process",
+    )
+    parser.add_argument("--json", help="also write results to this file")
+    parser.add_argument("--verbose", action="store_true")
+    rt_6_stubs.add_stub_arguments(parser)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,493 @@
+"""Локальные заглушки Deepgram и DeepL для офлайн-тестов и бенчмарков rt_6.py.
+
+Запуск:
+    python rt_6_stubs.py --deepl-latency lognormal:400,0.4 --deepl-429-rate 0.05
+
+после чего rt_6.py направляется на заглушки через переменные окружения
+DEEPGRAM_URL=ws://127.0.0.1:8765/v1/listen и
+DEEPL_URL=http://127.0.0.1:8766/v2/translate.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import subprocess
+from dataclasses import dataclass
+from http import HTTPStatus
+
+from aiohttp import web
+from websockets.server import serve  # type: ignore
+
+import rt_6
+
+# Сценарий, который «распознаёт» заглушка Deepgram: отрезок речи между
+# паузами становится фразой списка, номер которой задан частотой тона
+# (SENTENCE_BASE_HZ + i * SENTENCE_STEP_HZ), так что повтор звука после
+# переподключения распознаётся так же, как в первый раз
+DEFAULT_SCRIPT = [
+    "Welcome back to the show.",
+    "Today we are talking about real time translation.",
+    "The first thing you notice is the latency.",
+    "Every word has to travel to the server and back.",
+    "So we measure each stage of the pipeline.",
+    "Thanks for watching and see you next time.",
+]
+WORD_DURATION = 0.3  # секунды речи на слово в сценарии
+INTERIM_INTERVAL = 0.3  # секунды звука между interim-результатами
+ENDPOINTING = 0.3  # секунды тишины, после которых фраза финальная
+SILENCE_FINAL_INTERVAL = 3.0  # пустой финал на каждые N секунд тишины
+SPEECH_RMS = 300.0  # тот же порог, что у VAD в rt_6.py
+SENTENCE_BASE_HZ = 200.0
+SENTENCE_STEP_HZ = 50.0
+# Настоящий Deepgram отдаёт время не кратным сэмплу (позиция в байтах часто
+# нечётная); заглушка сдвигает каждую границу на долю этой величины, чтобы
+# повтор после переподключения проверялся на таких же значениях
+TIME_JITTER = 0.0002  # секунды, ~3 сэмпла
+
+
+class LatencyModel:
+    """Распределение задержки в секундах.
+
+    Формат: ``50`` (фиксированно, мс), ``uniform:100,300``,
+    ``normal:200,50`` (среднее, σ) или ``lognormal:200,0.5`` (медиана, σ).
+    """
+
+    def __init__(self, spec: str, rng: random.Random):
+        self.spec = spec
+        self.rng = rng
+        kind, _, args = spec.partition(":")
+        if not args:
+            kind, args = "fixed", kind
+        if kind not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+        self.kind = kind
+        self.args = [float(a) / 1000 for a in args.split(",")]
+        if kind == "lognormal":
+            self.args[1] = float(args.split(",")[1])  # σ безразмерная
+
+    def sample(self) -> float:
+        if self.kind == "fixed":
+            return self.args[0]
+        if self.kind == "uniform":
+            return self.rng.uniform(*self.args)
+        if self.kind == "normal":
+            return max(0.0, self.rng.gauss(*self.args))
+        median, sigma = self.args
+        return median * self.rng.lognormvariate(0.0, sigma)
+
+
+@dataclass
+class StubStats:
+    connections: int = 0
+    rejected: int = 0
+    dropped: int = 0
+    audio_bytes: int = 0
+    messages: int = 0
+    translate_requests: int = 0
+    translated_texts: int = 0
+    translated_chars: int = 0
+    rate_limited: int = 0
+    errors: int = 0
+
+
+class DeepgramStub:
+    """Websocket-сервер в формате Deepgram /v1/listen.
+
+    Понимает сырой linear16 (или, без ``encoding`` в адресе, любой формат,
+    который декодирует ffmpeg), KeepAlive, Finalize и CloseStream. Речь
+    определяется по энергии; слова фразы открываются по одному каждые
+    WORD_DURATION секунд, последнее слово interim бывает недослышанным.
+    """
+
+    def __init__(
+        self,
+        latency: LatencyModel,
+        error_rate: float = 0.0,
+        reject_rate: float = 0.0,
+        script: list[str] | None = None,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.reject_rate = reject_rate
+        self.script = script or DEFAULT_SCRIPT
+        self.rng = random.Random(seed)
+        self.stats = StubStats()
+
+    async def process_request(self, path, request_headers):
+        if not path.startswith("/v1/listen"):
+            return HTTPStatus.NOT_FOUND, [], b"Not found\n"
+        if self.rng.random() < self.reject_rate:
+            self.stats.rejected += 1
+            return HTTPStatus.TOO_MANY_REQUESTS, [("Retry-After", "1")], b""
+        return None
+
+    async def handler(self, ws, path=None):
+        self.stats.connections += 1
+        session = DeepgramStubSession(self, ws)
+        if "encoding=linear16" not in (path or ws.path):
+            await session.start_decoder()
+        await session.run()
+
+    def sentence_for(self, frame: bytes) -> str:
+        """Фраза сценария по частоте тона в первом кадре речи"""
+        _, zcr = rt_6.VoiceActivityGate.measure(frame)
+        frequency = zcr * rt_6.SAMPLE_RATE / 2
+        index = round((frequency - SENTENCE_BASE_HZ) / SENTENCE_STEP_HZ)
+        return self.script[index % len(self.script)]
+
+
+class DeepgramStubSession:
+    """Одно соединение заглушки Deepgram"""
+
+    def __init__(self, stub: DeepgramStub, ws):
+        self.stub = stub
+        self.ws = ws
+        # (время появления, сообщение); None — конец соединения
+        self.outbox: asyncio.Queue[tuple[float, str] | None] = asyncio.Queue()
+        self.last_due = 0.0
+        self.received = 0  # байт звука в этом соединении
+        self.pending = b""
+        self.speech_start: float | None = None
+        self.silence = 0.0
+        self.since_interim = 0.0
+        self.silence_final_start = 0.0
+        self.sentence: list[str] = []
+        # Сжатый звук (Ogg/Opus, FLAC) декодируется ffmpeg обратно в PCM
+        self.decoder: asyncio.subprocess.Process | None = None
+        self.decoder_task: asyncio.Task | None = None
+
+    async def start_decoder(self):
+        self.decoder = await asyncio.create_subprocess_exec(
+            "ffmpeg",
+            "-loglevel",
+            "error",
+            "-i",
+            "-",
+            "-f",
+            "s16le",
+            "-ac",
+            str(rt_6.CHANNELS),
+            "-ar",
+            str(rt_6.SAMPLE_RATE),
+            "-",
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self.decoder_task = asyncio.create_task(self.read_decoded())
+
+    async def read_decoded(self):
+        assert self.decoder and self.decoder.stdout
+        while data := await self.decoder.stdout.read(4096):
+            self.on_audio(data)
+
+    async def drain_decoder(self):
+        """Дождаться, пока ffmpeg отдаст весь принятый звук"""
+        if self.decoder and self.decoder.stdin and self.decoder_task:
+            self.decoder.stdin.close()
+            await self.decoder_task
+
+    @property
+    def now(self) -> float:
+        return self.received / rt_6.BYTES_PER_SECOND
+
+    async def run(self):
+        sender = asyncio.create_task(self.send_loop())
+        try:
+            async for message in self.ws:
+                if isinstance(message, str):
+                    control = json.loads(message)
+                    if control.get("type") == "CloseStream":
+                        await self.drain_decoder()
+                    if not self.on_control(control):
+                        break
+                else:
+                    self.stub.stats.audio_bytes += len(message)
+                    if self.decoder and self.decoder.stdin:
+                        self.decoder.stdin.write(message)
+                        await self.decoder.stdin.drain()
+                    else:
+                        self.on_audio(message)
+        except Exception:
+            pass
+        finally:
+            if self.decoder and self.decoder.returncode is None:
+                self.decoder.kill()
+                await self.decoder.wait()
+            self.outbox.put_nowait(None)
+            await sender
+
+    def on_control(self, message: dict) -> bool:
+        kind = message.get("type")
+        if kind == "Finalize":
+            self.finish_utterance(from_finalize=True)
+        elif kind == "CloseStream":
+            self.finish_utterance()
+            self.emit({"type": "Metadata", "duration": self.now})
+            return False
+        return True
+
+    def on_audio(self, data: bytes):
+        data = self.pending + data
+        frame = int(rt_6.CHUNK_SIZE)
+        while len(data) >= frame:
+            self.on_frame(data[:frame])
+            data = data[frame:]
+        self.pending = data
+
+    def on_frame(self, frame: bytes):
+        frame_start = self.now
+        self.received += len(frame)
+        if rt_6.VoiceActivityGate.measure(frame)[0] >= SPEECH_RMS:
+            if self.speech_start is None:
+                self.speech_start = frame_start
+                self.sentence = self.stub.sentence_for(frame).split()
+                self.since_interim = 0.0
+            self.silence = 0.0
+            self.since_interim += rt_6.CHUNK_DURATION
+            if self.since_interim >= INTERIM_INTERVAL:
+                self.since_interim = 0.0
+                self.emit_interim()
+        elif self.speech_start is not None:
+            self.silence += rt_6.CHUNK_DURATION
+            if self.silence >= ENDPOINTING:
+                self.finish_utterance(speech_end=self.now - self.silence)
+        elif self.now - self.silence_final_start >= SILENCE_FINAL_INTERVAL:
+            # Как и Deepgram, подтверждаем тишину пустыми финалами
+            self.emit_result("", self.silence_final_start, self.now, True)
+            self.silence_final_start = self.now
+
+    def emit_interim(self):
+        spoken = self.now - self.silence - self.speech_start
+        count = min(len(self.sentence), int(spoken / WORD_DURATION) + 1)
+        words = self.sentence[:count]
+        if count < len(self.sentence) and self.stub.rng.random() < 0.5:
+            words[-1] = words[-1][:3]  # недослышанное последнее слово
+        self.emit_result(" ".join(words), self.speech_start, self.now, False)
+
+    def finish_utterance(
+        self, speech_end: float | None = None, from_finalize: bool = False
+    ):
+        if self.speech_start is None:
+            return
+        end = self.now if speech_end is None else speech_end
+        self.emit_result(
+            " ".join(self.sentence),
+            self.speech_start,
+            end,
+            True,
+            speech_final=True,
+            from_finalize=from_finalize,
+        )
+        self.speech_start = None
+        self.silence = 0.0
+        self.silence_final_start = self.now
+
+    def emit_result(
+        self,
+        transcript: str,
+        start: float,
+        end: float,
+        is_final: bool,
+        speech_final: bool = False,
+        from_finalize: bool = False,
+    ):
+        self.emit(
+            {
+                "type": "Results",
+                "channel_index": [0, 1],
+                "start": self.reported_time(start),
+                "duration": self.reported_time(end) - self.reported_time(start),
+                "is_final": is_final,
+                "speech_final": speech_final,
+                "from_finalize": from_finalize,
+                "channel": {
+                    "alternatives": [
+                        {"transcript": transcript, "confidence": 0.99, "words": []}
+                    ]
+                },
+            }
+        )
+
+    @staticmethod
+    def reported_time(seconds: float) -> float:
+        """Граница как у Deepgram: дробная, одна для конца и следующего начала"""
+        skew = math.modf(seconds * 7919.0)[0] - 0.5
+        return seconds + skew * 2 * TIME_JITTER
+
+    def emit(self, message: dict):
+        loop = asyncio.get_running_loop()
+        self.outbox.put_nowait((loop.time(), json.dumps(message)))
+
+    async def send_loop(self):
+        """Отправляет сообщения по порядку с задержкой из модели"""
+        loop = asyncio.get_running_loop()
+        while (item := await self.outbox.get()) is not None:
+            emitted_at, message = item
+            due = emitted_at + self.stub.latency.sample()
+            self.last_due = max(self.last_due, due)
+            await asyncio.sleep(max(0.0, self.last_due - loop.time()))
+            if self.stub.rng.random() < self.stub.error_rate:
+                self.stub.stats.dropped += 1
+                await self.ws.close(code=1011, reason="Injected failure")
+                return
+            try:
+                await self.ws.send(message)
+            except Exception:
+                return
+            self.stub.stats.messages += 1
+        await self.ws.close()
+
+
+class DeepLStub:
+    """HTTP-заглушка DeepL /v2/translate.
+
+    Перевод детерминированный: ``[RU] <текст>``. Поддерживает несколько
+    полей ``text`` в одном запросе, ошибки 5xx и 429 с Retry-After, а
+    /v2/usage отдаёт число переведённых символов и ``char_limit``.
+    """
+
+    def __init__(
+        self,
+        latency: LatencyModel,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after: int = 1,
+        char_limit: int = 500_000,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.char_limit = char_limit
+        self.rng = random.Random(seed + 1)
+        self.stats = StubStats()
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v2/translate", self.translate)
+        app.router.add_get("/v2/usage", self.usage)
+        return app
+
+    async def usage(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "character_count": self.stats.translated_chars,
+                "character_limit": self.char_limit,
+            }
+        )
+
+    async def translate(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        texts = [str(t) for t in form.getall("text", [])]
+        target_lang = str(form.get("target_lang", "RU"))
+        self.stats.translate_requests += 1
+
+        await asyncio.sleep(self.latency.sample())
+        if self.rng.random() < self.rate_limit_rate:
+            self.stats.rate_limited += 1
+            return web.json_response(
+                {"message": "Too many requests"},
+                status=429,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+        if self.rng.random() < self.error_rate:
+            self.stats.errors += 1
+            return web.json_response({"message": "Internal error"}, status=500)
+
+        self.stats.translated_texts += len(texts)
+        self.stats.translated_chars += sum(len(t) for t in texts)
+        return web.json_response(
+            {
+                "translations": [
+                    {"detected_source_language": "EN", "text": f"[{target_lang}] {t}"}
+                    for t in texts
+                ]
+            }
+        )
+
+
+async def start_stubs(
+    deepgram: DeepgramStub,
+    deepl: DeepLStub,
+    host: str = "127.0.0.1",
+    deepgram_port: int = 0,
+    deepl_port: int = 0,
+):
+    """Поднять обе заглушки; возвращает (адрес Deepgram, адрес DeepL, stop)"""
+    rt_6.load_numpy()  # заглушка Deepgram меряет энергию каждого кадра
+    ws_server = await serve(
+        deepgram.handler,
+        host,
+        deepgram_port,
+        process_request=deepgram.process_request,
+    )
+    runner = web.AppRunner(deepl.make_app())
+    await runner.setup()
+    site = web.TCPSite(runner, host, deepl_port)
+    await site.start()
+
+    ws_port = ws_server.sockets[0].getsockname()[1]
+    http_port = site._server.sockets[0].getsockname()[1]  # type: ignore
+
+    async def stop():
+        ws_server.close()
+        await ws_server.wait_closed()
+        await runner.cleanup()
+
+    return (
+        f"ws://{host}:{ws_port}/v1/listen",
+        f"http://{host}:{http_port}/v2/translate",
+        stop,
+    )
+
+
+async def main(args):
+    rng = random.Random(args.seed)
+    deepgram = DeepgramStub(
+        LatencyModel(args.asr_latency, rng),
+        error_rate=args.asr_error_rate,
+        reject_rate=args.asr_429_rate,
+        seed=args.seed,
+    )
+    deepl = DeepLStub(
+        LatencyModel(args.deepl_latency, rng),
+        error_rate=args.deepl_error_rate,
+        rate_limit_rate=args.deepl_429_rate,
+        seed=args.seed,
+    )
+    deepgram_url, deepl_url, stop = await start_stubs(
+        deepgram, deepl, args.host, args.deepgram_port, args.deepl_port
+    )
+    print(f"DEEPGRAM_URL={deepgram_url}")
+    print(f"DEEPL_URL={deepl_url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await stop()
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--asr-latency", default="lognormal:150,0.3")
+    parser.add_argument("--asr-error-rate", type=float, default=0.0)
+    parser.add_argument("--asr-429-rate", type=float, default=0.0)
+    parser.add_argument("--deepl-latency", default="lognormal:150,0.4")
+    parser.add_argument("--deepl-error-rate", type=float, default=0.0)
+    parser.add_argument("--deepl-429-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Deepgram and DeepL stubs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--deepgram-port", type=int, default=8765)
+    parser.add_argument("--deepl-port", type=int, default=8766)
+    add_stub_arguments(parser)
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
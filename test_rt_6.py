@@ -0,0 +1,269 @@
+"""Проверки rt_6.py без сети: python -m unittest test_rt_6"""
+
+import array
+import asyncio
+import json
+import multiprocessing
+import time
+import unittest
+
+import rt_6
+from websockets.exceptions import ConnectionClosedOK  # type: ignore
+
+
+class FakeWebSocket:
+    """Отдаёт заранее заданные ответы Deepgram и запоминает отправленное"""
+
+    def __init__(self, messages: list[dict] | None = None):
+        self.messages = [json.dumps(message) for message in messages or []]
+        self.sent: list[bytes] = []
+
+    async def recv(self) -> str:
+        if not self.messages:
+            raise ConnectionClosedOK(None, None)
+        return self.messages.pop(0)
+
+    async def send(self, data):
+        if not isinstance(data, str):
+            self.sent.append(bytes(data))
+
+
+class RecordingStream(rt_6.DeepgramStream):
+    def __init__(self):
+        super().__init__(source="-", speed=None, codec="linear16")
+        self.finals: list[rt_6.TranscriptSegment] = []
+
+    def submit_final(self, segment: rt_6.TranscriptSegment):
+        self.finals.append(segment)
+
+    def on_interim(self, segment: rt_6.TranscriptSegment):
+        pass
+
+
+class DeadParent:
+    def is_alive(self) -> bool:
+        return False
+
+
+def audio_process_stream(channel) -> rt_6.AudioProcessStream:
+    options = {
+        "source": "-",
+        "speed": None,
+        "codec": "linear16",
+        "overflow": rt_6.OVERFLOW_POLICY,
+        "listen_url": "",
+        "started_at": 0.0,
+    }
+    return rt_6.AudioProcessStream(options, channel)
+
+
+class OrphanedCaptureTest(unittest.IsolatedAsyncioTestCase):
+    async def test_closed_channel_ends_session(self):
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        receiver.close()  # основной процесс умер
+        stream = audio_process_stream(sender)
+        final = {
+            "channel": {"alternatives": [{"transcript": "hello"}]},
+            "start": 0.0,
+            "duration": 1.0,
+            "is_final": True,
+        }
+        stream.session_active = True
+        await stream.receive_results(FakeWebSocket([final, final]))
+        self.assertFalse(stream.session_active)
+        sender.close()
+
+    async def test_dead_parent_ends_session(self):
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        stream = audio_process_stream(sender)
+        stream.parent = DeadParent()
+        stream.session_active = True
+        await stream.watch_parent()
+        self.assertFalse(stream.session_active)
+        receiver.close()
+        sender.close()
+
+
+class ReplayAlignmentTest(unittest.IsolatedAsyncioTestCase):
+    def test_stream_offset_is_frame_aligned(self):
+        for seconds in (0.0313, 1.23456, 7.00003, 59.99997):
+            offset = rt_6.stream_offset(seconds)
+            self.assertEqual(offset % rt_6.FRAME_SIZE, 0)
+            self.assertLessEqual(offset, seconds * rt_6.BYTES_PER_SECOND)
+
+    async def test_replay_from_odd_end_time(self):
+        stream = RecordingStream()
+        samples = array.array("h", range(-8000, 8000))  # секунда, все сэмплы разные
+        stream.ring.write(samples.tobytes())
+        stream.capture_done = True
+
+        # 0.5313 с -> 17001.6 байта: без округления повтор шёл бы с нечётного
+        end = 0.5313
+        final = {
+            "channel": {"alternatives": [{"transcript": "hello"}]},
+            "start": 0.0,
+            "duration": end,
+            "is_final": True,
+        }
+        stream.session_active = True
+        await stream.receive_results(FakeWebSocket([final]))
+        self.assertEqual(len(stream.finals), 1)
+        self.assertEqual(stream.acked_offset % rt_6.FRAME_SIZE, 0)
+
+        # Переподключение: повтор с подтверждённого места
+        ws = FakeWebSocket()
+        cursor = max(stream.acked_offset, stream.ring.start)
+        self.assertTrue(await stream.send_audio(ws, cursor))
+        replayed = array.array("h")
+        replayed.frombytes(b"".join(ws.sent))
+        first = stream.acked_offset // rt_6.FRAME_SIZE
+        self.assertEqual(replayed.tolist(), samples[first:].tolist())
+
+    async def test_drop_oldest_keeps_unacknowledged_replay(self):
+        stream = RecordingStream()
+        stream.live_source = True  # как у pulse: включена политика drop-oldest
+        stream.overflow = "drop-oldest"
+        chunk = bytes(rt_6.CHUNK_SIZE)
+        for _ in range(100):  # 10 с звука, из них первые 6 с уже отправлены
+            stream.ring.write(chunk)
+        stream.send_cursor = 60 * rt_6.CHUNK_SIZE
+        stream.acked_offset = 20 * rt_6.CHUNK_SIZE
+        stream.capture_done = True
+
+        ws = FakeWebSocket()
+        await stream.send_audio(ws, stream.acked_offset)
+        # Повтор 2..6 с целиком, затем из 4 с нового звука остаются 2
+        self.assertEqual(stream.replayed_bytes, 40 * rt_6.CHUNK_SIZE)
+        self.assertEqual(stream.dropped_bytes, 20 * rt_6.CHUNK_SIZE)
+        self.assertEqual(sum(map(len, ws.sent)), 60 * rt_6.CHUNK_SIZE)
+
+
+class LRUCacheTest(unittest.TestCase):
+    def test_evicts_oldest_by_count(self):
+        cache = rt_6.LRUCache(max_entries=2, ttl=None)
+        cache.put("a", "1")
+        cache.put("b", "2")
+        cache.get("a")  # "b" теперь самый старый
+        cache.put("c", "3")
+        self.assertNotIn("b", cache)
+        self.assertEqual(cache.get("a"), "1")
+        self.assertEqual(cache.evictions, 1)
+
+    def test_evicts_by_bytes(self):
+        value = "x" * 1000
+        cache = rt_6.LRUCache(max_entries=100, max_bytes=2500, ttl=None)
+        for key in ("a", "b", "c"):
+            cache.put(key, value)
+        self.assertEqual(len(cache), 2)
+        self.assertNotIn("a", cache)
+        self.assertLessEqual(cache.bytes, 2500)
+
+    def test_expired_entry_is_a_miss(self):
+        cache = rt_6.LRUCache(ttl=0.01)
+        cache.put("a", "1")
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("a"))
+        self.assertNotIn("a", cache)
+        self.assertEqual((cache.expirations, cache.misses, cache.bytes), (1, 1, 0))
+
+
+class TokenBucketTest(unittest.IsolatedAsyncioTestCase):
+    async def test_finals_are_served_first(self):
+        bucket = rt_6.TokenBucket(rate=50, burst=1)
+        bucket.tokens = 0.0
+        order = []
+
+        async def request(name: str, priority: int):
+            await bucket.acquire(priority)
+            order.append(name)
+
+        interim = asyncio.create_task(request("interim", rt_6.PRIORITY_INTERIM))
+        await asyncio.sleep(0)  # interim встал в очередь первым
+        await request("final", rt_6.PRIORITY_FINAL)
+        await interim
+        self.assertEqual(order, ["final", "interim"])
+
+    async def test_interim_is_shed_after_max_wait(self):
+        bucket = rt_6.TokenBucket(rate=0.1, burst=1, interim_max_wait=0.05)
+        bucket.tokens = 0.0
+        with self.assertRaises(rt_6.RequestShed):
+            await bucket.acquire(rt_6.PRIORITY_INTERIM)
+        self.assertEqual(bucket.shed, 1)
+
+    async def test_throttle_pauses_and_halves_rate(self):
+        bucket = rt_6.TokenBucket(rate=100, burst=5, min_rate=1)
+        bucket.throttle(0.1)
+        self.assertEqual(bucket.rate, 50)
+        with self.assertRaises(rt_6.RequestShed):
+            await bucket.acquire(rt_6.PRIORITY_INTERIM)  # паузу не пережидает
+        started = time.monotonic()
+        await bucket.acquire(rt_6.PRIORITY_FINAL)
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+
+class SplitSentencesTest(unittest.TestCase):
+    def test_splits_on_sentence_end(self):
+        self.assertEqual(
+            rt_6.split_sentences("Hello there. How are you? Fine!"),
+            ["Hello there.", "How are you?", "Fine!"],
+        )
+
+    def test_keeps_abbreviations_and_initials(self):
+        self.assertEqual(
+            rt_6.split_sentences("Mr. Smith met Dr. Jones. They talked."),
+            ["Mr. Smith met Dr. Jones.", "They talked."],
+        )
+        self.assertEqual(
+            rt_6.split_sentences("J. R. R. Tolkien wrote it, e.g. this one. Yes"),
+            ["J. R. R. Tolkien wrote it, e.g. this one.", "Yes"],
+        )
+
+    def test_closing_quote_stays_with_sentence(self):
+        self.assertEqual(
+            rt_6.split_sentences('He said "stop." Then (quietly.) left.'),
+            ['He said "stop."', "Then (quietly.)", "left."],
+        )
+
+
+class FuzzyTranslationIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = rt_6.LRUCache(ttl=None)
+        self.index = rt_6.FuzzyTranslationIndex()
+
+    def add(self, text: str, translated: str):
+        key = f"RU:{text}"
+        self.cache.put(key, translated)
+        self.index.add("RU", key, text)
+
+    def test_fillers_and_punctuation_match(self):
+        self.add("we start at noon", "начинаем в полдень")
+        found = self.index.lookup("RU", "um, we start at noon!", 0.0, self.cache)
+        self.assertEqual(found, "начинаем в полдень")
+        self.assertEqual(self.index.canonical_hits, 1)
+        # Пробы не попадают в счётчики LRU-кэша
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 0))
+
+    def test_distance_limit(self):
+        self.add("the meeting starts at noon today", "встреча в полдень")
+        one_word = "the meeting starts at ten today"
+        two_words = "the meeting ends at ten today"
+        self.assertEqual(
+            self.index.lookup("RU", one_word, 0.2, self.cache), "встреча в полдень"
+        )
+        self.assertIsNone(self.index.lookup("RU", two_words, 0.2, self.cache))
+        self.assertIsNone(self.index.lookup("DE", one_word, 0.2, self.cache))
+        self.assertEqual(self.index.near_hits, 1)
+
+    def test_evicted_keys_are_removed(self):
+        self.cache = rt_6.LRUCache(max_entries=1, ttl=None)
+        self.add("good morning everyone", "доброе утро всем")
+        self.add("see you tomorrow", "до завтра")
+        self.assertIsNone(
+            self.index.lookup("RU", "good morning everyone", 0.0, self.cache)
+        )
+        self.assertNotIn("RU:good morning everyone", self.index.entries)
+        self.assertNotIn(("RU", "morning"), self.index.postings)
+
+
+if __name__ == "__main__":
+    unittest.main()